@@ -0,0 +1,76 @@
+#! usr/bin/env python3
+import threading
+import numpy as np
+import pygame
+from typing import Dict, List, Tuple
+from src.utility_image import ImageUtil
+
+
+class Background:
+    """ Process-wide provider of gradient backgrounds, memoized by (size, style).
+        Gradients are built directly as uint8 palette indices (a gray ramp), so there's no float
+        meshgrid or smoothscale, and every Level, context and the editor share one surface per size.
+        Returned surfaces are shared; copy one before drawing on it.
+    """
+
+    STYLES: Tuple[str, ...] = ("diagonal", "horizontal", "vertical")
+    GRAYS: Dict[int, List[int]] = {n: [n, n, n] for n in range(256)}
+
+    _gradients: Dict[Tuple[Tuple[int, int], str], pygame.Surface] = {}
+    _converted: Dict[Tuple[Tuple[int, int], str], pygame.Surface] = {}
+    _lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def ramp(n: int, i_max: int) -> np.ndarray:
+        """ Returns n uint8 values rising evenly from 0 to i_max.
+        """
+        return (np.arange(n, dtype=np.uint32) * i_max // max(n - 1, 1)).astype(np.uint8)
+
+    @staticmethod
+    def indices(size: Tuple[int, int], style: str) -> np.ndarray:
+        """ Returns a (w, h) uint8 array of gray levels: dark at the top-left, light at the far side.
+        """
+        w, h = size
+        if style == "diagonal":
+            return np.add.outer(Background.ramp(w, 127), Background.ramp(h, 128))
+        elif style == "horizontal":
+            return np.repeat(Background.ramp(w, 255)[:, None], h, axis=1)
+        elif style == "vertical":
+            return np.repeat(Background.ramp(h, 255)[None, :], w, axis=0)
+        raise ValueError("Unknown background style: {}".format(style))
+
+    @classmethod
+    def gradient(cls, size: Tuple[int, int], style: str = "diagonal") -> pygame.Surface:
+        """ Returns the 8-bit gray gradient of a size and style, building it only once.
+        """
+        key = tuple(size), style
+        with cls._lock:
+            surface: pygame.Surface = cls._gradients.get(key)
+            if surface is None:
+                surface = ImageUtil.indexed_surface(Background.indices(key[0], style), Background.GRAYS)
+                cls._gradients[key] = surface
+            return surface
+
+    @classmethod
+    def get(cls, size: Tuple[int, int], style: str = "diagonal") -> pygame.Surface:
+        """ Returns a gradient in the display's pixel format (see ImageUtil.display_format), converting it only once.
+            Headless, this is the 8-bit gradient itself.
+        """
+        surface: pygame.Surface = cls.gradient(size, style)
+        if pygame.display.get_surface() is None:
+            return surface
+        key = tuple(size), style
+        with cls._lock:
+            converted: pygame.Surface = cls._converted.get(key)
+            if converted is None:
+                converted = ImageUtil.display_format(surface)
+                cls._converted[key] = converted
+            return converted
+
+    @classmethod
+    def clear(cls):
+        """ Drops every memoized gradient, e.g. after the display's pixel format changes.
+        """
+        with cls._lock:
+            cls._gradients.clear()
+            cls._converted.clear()
@@ -0,0 +1,153 @@
+#! usr/bin/env python3
+import atexit
+import json
+import time
+import numpy as np
+import pygame
+from typing import Dict, List
+
+
+class FrameProfiler:
+    """ Per-phase frame timings, kept in a fixed-size ring buffer of perf_counter_ns samples.
+        Each frame is one row: nanoseconds spent in every phase, the frame's total work, and the
+        interval since the previous frame ended (which includes any sleeping, so it gives the FPS).
+        While disabled, `begin`, `mark` and `end` return after a single attribute check.
+    """
+
+    PHASES: tuple = ("events", "animate", "background", "blocks", "cursor", "flip")
+    COLUMNS: tuple = PHASES + ("work", "interval")
+    INDEX: Dict[str, int] = {x: i for i, x in enumerate(COLUMNS)}
+    CAPACITY: int = 600
+    OVERLAY_PERIOD: int = 15  # Frames between overlay text refreshes
+    OVERLAY_POS: tuple = (2, 2)
+    OVERLAY_COLORS: tuple = ((255, 255, 0), (0, 0, 0))
+
+    __slots__ = [
+        "enabled",
+        "overlay",
+        "samples",
+        "count",
+        "_row",
+        "_start",
+        "_last",
+        "_end",
+        "_font",
+        "_text",
+        "overlay_rect"
+    ]
+
+    def __init__(self, capacity: int = CAPACITY, enabled: bool = False):
+        self.enabled: bool = enabled
+        self.overlay: bool = False
+        self.samples: np.ndarray = np.zeros((capacity, len(FrameProfiler.COLUMNS)), dtype=np.int64)
+        self.count: int = 0
+        self._row: List[int] = [0] * len(FrameProfiler.COLUMNS)
+        self._start: int = 0
+        self._last: int = 0
+        self._end: int = 0
+        self._font: pygame.font.Font = None
+        self._text: pygame.Surface = None
+        self.overlay_rect: pygame.Rect = pygame.Rect(FrameProfiler.OVERLAY_POS, (0, 0))
+
+    def __len__(self) -> int:
+        return min(self.count, len(self.samples))
+
+    def begin(self):
+        """ Starts a frame.
+        """
+        if not self.enabled:
+            return
+        self._row = [0] * len(FrameProfiler.COLUMNS)
+        self._start = self._last = time.perf_counter_ns()
+
+    def mark(self, s_phase: str):
+        """ Charges the time since the last mark (or `begin`) to a phase. A phase may be marked many times a frame.
+        """
+        if not self.enabled:
+            return
+        now: int = time.perf_counter_ns()
+        self._row[FrameProfiler.INDEX[s_phase]] += now - self._last
+        self._last = now
+
+    def end(self):
+        """ Finishes a frame and stores it in the ring buffer.
+        """
+        if not self.enabled or not self._start:
+            return
+        now: int = time.perf_counter_ns()
+        self._row[-2] = now - self._start
+        self._row[-1] = now - self._end if self._end else 0
+        self._end = now
+        self._start = 0
+        self.samples[self.count % len(self.samples)] = self._row
+        self.count += 1
+
+    def toggle_overlay(self):
+        """ Shows or hides the overlay, enabling the profiler when it's shown.
+        """
+        self.overlay = not self.overlay
+        self.enabled = self.enabled or self.overlay
+
+    def clear(self):
+        self.samples[:] = 0
+        self.count = 0
+        self._start = self._end = 0
+
+    def frames(self) -> np.ndarray:
+        """ Returns the buffered frames, oldest first, in nanoseconds.
+        """
+        i_count: int = len(self)
+        if self.count <= len(self.samples):
+            return self.samples[:i_count].copy()
+        i_next: int = self.count % len(self.samples)
+        return np.concatenate((self.samples[i_next:], self.samples[:i_next]))
+
+    def summary(self) -> Dict[str, float]:
+        """ Mean time per phase, frame time (mean, p50, p99) in milliseconds, and FPS, over the buffered frames.
+        """
+        frames: np.ndarray = self.frames()
+        if not len(frames):
+            return {}
+        output: Dict[str, float] = {x: float(frames[:, i].mean()) / 1e6 for i, x in enumerate(FrameProfiler.PHASES)}
+        work: np.ndarray = frames[:, -2] / 1e6
+        intervals: np.ndarray = frames[:, -1][frames[:, -1] > 0]
+        output["frame"] = float(work.mean())
+        output["p50"] = float(np.percentile(work, 50))
+        output["p99"] = float(np.percentile(work, 99))
+        output["fps"] = 1e9 / float(intervals.mean()) if len(intervals) else 0.0
+        return output
+
+    def draw(self, dest: pygame.Surface) -> pygame.Rect:
+        """ Draws the overlay and returns the rect it covers.
+        """
+        if self._text is None or self.count % FrameProfiler.OVERLAY_PERIOD == 0:
+            if self._font is None:
+                pygame.font.init()
+                self._font = pygame.font.Font(None, 14)
+            d = self.summary()
+            s_text: str = "{:.2f} ms  p50 {:.2f}  p99 {:.2f}  {:.0f} fps".format(
+                  d.get("frame", 0.0), d.get("p50", 0.0), d.get("p99", 0.0), d.get("fps", 0.0)
+            )
+            self._text = self._font.render(s_text, False, *FrameProfiler.OVERLAY_COLORS)
+        self.overlay_rect = dest.blit(self._text, FrameProfiler.OVERLAY_POS)
+        return self.overlay_rect
+
+    def dump(self, filename: str):
+        """ Writes the buffered frames (in milliseconds) as CSV, or as JSON with a summary if `filename` ends in .json.
+        """
+        frames: np.ndarray = self.frames() / 1e6
+        if filename.lower().endswith(".json"):
+            with open(filename, "w") as f:
+                json.dump({
+                    "columns": list(FrameProfiler.COLUMNS),
+                    "frames": frames.tolist(),
+                    "summary": self.summary()
+                }, f)
+        else:
+            np.savetxt(filename, frames, fmt="%.4f", delimiter=",", header=",".join(FrameProfiler.COLUMNS), comments="")
+
+    def dump_on_exit(self, filename: str):
+        """ Enables the profiler and dumps its trace when the process exits.
+        """
+        self.enabled = True
+        atexit.register(self.dump, filename)
@@ -0,0 +1,127 @@
+#! usr/bin/env python3
+import hashlib
+import threading
+import pygame
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+from src.sprite_cache import SpriteCache
+from src.utility_image import ImageUtil
+
+
+class ImageCache:
+    """ Process-wide cache of decoded image surfaces, keyed by content: (image string hash, w, h, palette).
+        Identical sprites are decoded once no matter how many levels use them. Entries are evicted
+        least-recently-used first once the cached surfaces exceed a byte budget.
+        Cached surfaces are shared; copy one before modifying it.
+        Misses are decoded through an optional on-disk SpriteCache, e.g. ImageCache.SHARED.disk = SpriteCache().
+    """
+
+    BUDGET: int = 8 * 1024 * 1024
+    SHARED: "ImageCache" = None  # The instance used by LevelImage and Renderer
+
+    __slots__ = [
+        "budget",
+        "entries",
+        "size",
+        "hits",
+        "misses",
+        "evictions",
+        "disk",
+        "lock"
+    ]
+
+    def __init__(self, budget: int = BUDGET, disk: SpriteCache = None):
+        self.budget: int = budget
+        self.disk: SpriteCache = disk
+        self.entries: OrderedDict = OrderedDict()
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Tuple) -> bool:
+        return key in self.entries
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """ Hit, miss and eviction counters, plus the current entry count and size in bytes.
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.size
+            }
+
+    @staticmethod
+    def palette_id(palette: Dict[int, List[int]]) -> Tuple[Tuple[int, ...], ...]:
+        """ Returns a hashable identity for a palette (its colors, in index order).
+        """
+        return tuple(tuple(x) for x in ImageUtil.palette_colors(palette))
+
+    @staticmethod
+    def key(s_value: str, palette: Dict[int, List[int]], w: int, h: int) -> Tuple:
+        """ Returns the cache key of an image string decoded at a given size with a given palette.
+        """
+        return hashlib.sha1(s_value.encode()).digest(), w, h, ImageCache.palette_id(palette)
+
+    @staticmethod
+    def sizeof(surface: pygame.Surface) -> int:
+        """ Returns the pixel memory held by a surface, in bytes.
+        """
+        return surface.get_pitch() * surface.get_height()
+
+    def get(self, s_value: str, palette: Dict[int, List[int]], w: int, h: int) -> pygame.Surface:
+        """ Returns the decoded surface of an image string, decoding it only on a miss.
+        """
+        key: Tuple = ImageCache.key(s_value, palette, w, h)
+        with self.lock:
+            surface: pygame.Surface = self.entries.get(key)
+            if surface is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return surface
+            self.misses += 1
+
+        if self.disk:
+            surface = ImageUtil.indexed_surface(self.disk.decode(s_value, w, h), palette)
+        else:
+            surface = ImageUtil.convert_image(s_value, palette, w, h)
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = surface
+                self.size += ImageCache.sizeof(surface)
+                self._evict()
+            return self.entries.get(key, surface)
+
+    def clear(self):
+        """ Drops every entry. Surfaces already handed out stay valid.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def reset_stats(self):
+        """ Zeroes all counters.
+        """
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def _evict(self):
+        """ Drops least-recently-used entries until the cache fits its budget. Caller holds the lock.
+        """
+        while self.size > self.budget and self.entries:
+            _, surface = self.entries.popitem(last=False)
+            self.size -= ImageCache.sizeof(surface)
+            self.evictions += 1
+
+
+ImageCache.SHARED = ImageCache()
@@ -1,13 +1,19 @@
 #! usr/bin/env python3
+import sys
 import pygame
-import numpy as np
 from typing import Dict, List, Set, Tuple
+from src.background import Background
 from src.block_system import BlockSystem
+from src.image_cache import ImageCache
 from src.level_image import LevelImage
 from src.level_interface import LevelInterface
+from src.level_pack import LevelPack
+from src.level_script import LevelScript
 from src.renderer import Renderer
+from src.script_cache import ScriptCache
+from src.sprite_cache import SpriteCache
 from src.render_context import RenderContext
-from src.utility import Utility, ScriptParser
+from src.utility import ScriptParser
 
 
 class Level:
@@ -19,15 +25,24 @@ class Level:
         "system",
         "interface",
         "images",
-        "background",
         "scale_changing",
         "cursor",
-        "is_resetting"
+        "is_resetting",
+        "frame_blocks",
+        "frame_state",
+        "scene_layer",
+        "scene_static",
+        "scene_state"
     ]
 
     ANIMATE_SPEED: float = 6.0
     ANIMATE_PAUSE: float = 0.1
     BLOCK_ANCHOR: str = "center"
+    BACKGROUND_STYLE: str = "diagonal"
+    DIRTY_LIMIT: int = 24  # Beyond this many dirty rects, a full repaint is cheaper
+    STATIC_LAYER: bool = False  # Opt-in: composite resting blocks into a cached layer (slower with RLE display sprites)
+    IDLE_TIMEOUT: int = 250  # Longest an idle frame sleeps waiting for input, in ms (0 to always run at full rate)
+    SCRIPT_CACHE: ScriptCache = None  # Opt-in, e.g. Level.SCRIPT_CACHE = ScriptCache()
 
     def __init__(self, context: RenderContext):
         self.renderer = Renderer(context)
@@ -39,96 +54,54 @@ class Level:
         self.scale_changing: float = 0.0
         self.is_resetting: bool = False
 
-        # TODO: MOVE INTO SOMETHING NICE
-        # Gray gradient background generation
-        def gray(im):
-            im = 255 * (im / im.max())
-            w, h = im.shape
-            ret = np.empty((w, h, 3), dtype=np.uint8)
-            ret[:, :, 2] = ret[:, :, 1] = ret[:, :, 0] = im
-            return ret
-
-        sw, sh = self.renderer.screen_size
-        x = np.arange(0, sw)
-        y = np.arange(0, sh)
-        xx, yy = np.meshgrid(x, y)
-        z = xx + yy
-        z = 255 * z / z.max()
-        z = gray(z)
-        s = pygame.surfarray.make_surface(z)
-        s = pygame.transform.smoothscale(s, (sw, sh))
-        self.background = s
+        # What was drawn last frame, for dirty-rectangle tracking
+        self.frame_blocks: Dict[str, Tuple[pygame.Surface, pygame.Rect]] = {}
+        self.frame_state: tuple = ()
+
+        # Retained static layer: the background plus every block that isn't animating
+        self.scene_layer: pygame.Surface = None
+        self.scene_static: Dict[str, Tuple[pygame.Surface, pygame.Rect]] = {}
+        self.scene_state: tuple = ()
+
+    @property
+    def background(self) -> pygame.Surface:
+        """ Shared with every other Level of the same screen size, and reconverted whenever the display is reopened.
+        """
+        return Background.get(self.renderer.screen_size, Level.BACKGROUND_STYLE)
 
     @classmethod
-    def from_script(cls, s: BlockSystem, i: LevelInterface, im: LevelImage, filename: str, *, headless=False):
+    def from_script(
+          cls,
+          s: BlockSystem,
+          i: LevelInterface,
+          im: LevelImage,
+          filename: str,
+          *,
+          headless=False,
+          cache: ScriptCache = None
+    ):
         """ Interprets a level as defined within a script file. In-place.
+            Uses `cache` (or the class-wide SCRIPT_CACHE) to skip tokenizing unchanged files.
+        """
+        s.clear()
+        i.clear()
+        im.clear()
+        cache = cache or Level.SCRIPT_CACHE
+        if cache:
+            statements = cache.statements(filename)
+        else:
+            statements = ScriptParser.stream(filename)
+        LevelScript.interpret(s, i, im, statements, headless=headless, filename=filename)
+
+    @classmethod
+    def from_pack(cls, s: BlockSystem, i: LevelInterface, im: LevelImage, pack: LevelPack, name: str, *, headless=False):
+        """ Interprets a single level stored within a level pack. In-place.
         """
         s.clear()
         i.clear()
         im.clear()
-        d: Dict[int, Tuple[Tuple[str], Tuple[str]]] = ScriptParser.parse(filename)
-        l_keys: List[int] = Utility.dict_keys_in_order(d)
-        for i_key in l_keys:
-            t_statement: Tuple[Tuple[str], Tuple[str]] = d[i_key]
-            t_header: Tuple[str] = t_statement[0]
-            t_params: Tuple[str] = t_statement[1]
-            if "SYSTEM" in t_header:
-                if "CYCLE" in t_header:
-                    if "ADD" in t_header:
-                        s.cycle_add(t_params[0], t_params[1:])
-                if "NODE" in t_header:
-                    if "CREATE" in t_header:
-                        s.node_create(t_params[0])
-                    if "SETVALUE" in t_header:
-                        s.node_set_value(t_params[0], t_params[1])
-                    if "SETCYCLE" in t_header:
-                        s.node_set_cycle(t_params[0], t_params[1])
-                    if "SETIMMUNE" in t_header:
-                        s.node_set_immune(t_params[0], Utility.stob(t_params[1]))
-                    if "SETSTATIC" in t_header:
-                        s.node_set_static(t_params[0], Utility.stob(t_params[1]))
-                    if "SETTARGET" in t_header:
-                        s.node_set_target(t_params[0], t_params[1])
-                    if "LINKSINGLE" in t_header:
-                        s.node_link_single(t_params[0], t_params[1])
-                    if "LINKDOUBLE" in t_header:
-                        s.node_link_double(t_params[0], t_params[1])
-            if "INTERFACE" in t_header:
-                if "BLOCK" in t_header:
-                    if "CREATE" in t_header:
-                        # Label
-                        i.block_create(t_params[0])
-                    if "SETIMAGE" in t_header:
-                        # Label 1 (block), label 2 (image)
-                        i.block_set_image(t_params[0], t_params[1])
-                    if "SETNODE" in t_header:
-                        # Label 1 (block), label 2 (node)
-                        i.block_set_node(t_params[0], t_params[1])
-                    if "SETPOSITION" in t_header:
-                        # Label, x, y
-                        i.block_set_position(t_params[0], int(t_params[1]), int(t_params[2]))
-                    if "SETRECT" in t_header:
-                        # Label, dx, dy, w, h
-                        i.block_set_rect(
-                              t_params[0],
-                              int(t_params[1]),
-                              int(t_params[2]),
-                              int(t_params[3]),
-                              int(t_params[4])
-                        )
-            if "IMAGE" in t_header and not headless:
-                if "ADDIMAGE" in t_header:
-                    # Label
-                    im.image_add(t_params[0])
-                if "ADDKEY" in t_header:
-                    # Label
-                    im.image_add_key(t_params[0])
-                if "SETINDEX" in t_header:
-                    # Label 1 (image), index, label 2 (mapped image)
-                    im.image_set_index(t_params[0], int(t_params[1]), t_params[2])
-                if "SETVALUE" in t_header:
-                    # Label, value, width, height
-                    im.image_set_value(t_params[0], t_params[1], int(t_params[2]), int(t_params[3]))
+        s_filename: str = "{}:{}".format(pack.filename, name)
+        LevelScript.interpret(s, i, im, pack.stream(name), headless=headless, filename=s_filename)
 
     def clear(self) -> None:
         self.system.clear()
@@ -151,6 +124,24 @@ class Level:
         Level.from_script(self.system, self.interface, self.images, filename)
         self.coordinate()
 
+    def load_from_pack(self, pack: LevelPack, name: str) -> None:
+        """ Populates local level data from a single level within a level pack.
+        """
+        Level.from_pack(self.system, self.interface, self.images, pack, name)
+        self.coordinate()
+
+    def swap(self, system: BlockSystem, interface: LevelInterface, images: LevelImage) -> None:
+        """ Replaces the current level data with an already-loaded level, e.g. one from a LevelLoader.
+        """
+        self.system = system
+        self.interface = interface
+        self.images = images
+        self.scale_changing = 0.0
+        self.is_resetting = False
+        self.frame_state = ()
+        self.scene_layer = None
+        self.coordinate()
+
     def press_block(self, x: int, y: int) -> None:
         """ Finds and presses a block, if any, at the given (x,y) coordinate.
         """
@@ -224,43 +215,156 @@ class Level:
         if not has_changing:
             self.scale_changing = 0.0
 
+    def background_state(self) -> str:
+        """ Returns which background the level currently shows.
+        """
+        if self.system.is_solved() and not self.scale_changing:
+            return "solved"
+        elif self.is_resetting:
+            return "resetting"
+        return "default"
+
     def draw_background(self, dest: pygame.Surface) -> None:
         """ Renders background for current level.
         """
-        if self.system.is_solved() and not self.scale_changing:
+        s_state: str = self.background_state()
+        if s_state == "solved":
             dest.fill((0, 128, 0))
-        elif self.is_resetting:
+        elif s_state == "resetting":
             dest.fill((128, 0, 0))
         else:
-            dest.blit(self.background, (0, 0))
+            dest.blit(self.renderer.scaled(self.background), (0, 0))
 
-    def draw_blocks(self, dest: pygame.Surface) -> None:
-        """ Renders all blocks in current level.
+    def block_frames(self) -> Dict[str, Tuple[pygame.Surface, pygame.Rect]]:
+        """ Returns what each block draws this frame: its (possibly scaled) image and destination rect.
+            Both are in the renderer's target coordinates, i.e. enlarged by its zoom when sprites are pre-scaled.
         """
+        output: Dict[str, Tuple[pygame.Surface, pygame.Rect]] = {}
+        dx, dy = self.interface.field_position
+        anchor = Level.BLOCK_ANCHOR
+        i_zoom: int = self.renderer.zoom
         for s_blocklabel in self.interface.blocks:
             s_imglabel, i_index = self.interface.block_get_image(s_blocklabel)
-            im_blockimg: pygame.Surface = self.images.image_get(s_imglabel, i_index)
             scale: float = self.interface.block_get_scale_old(s_blocklabel)
-            if scale > 0:
-                w, h = im_blockimg.get_size()
-                new_w = int(round(w * scale))
-                new_h = int(round(h * scale))
-                im_blockimg = pygame.transform.scale(im_blockimg, (w, new_h))
+            im_blockimg: pygame.Surface = self.images.image_get_display(s_imglabel, i_index, scale if scale > 0 else 1.0, i_zoom)
             x, y = self.interface.block_get_position(s_blocklabel)
-            x += self.interface.field_position[0]
-            y += self.interface.field_position[1]
-            anchor = Level.BLOCK_ANCHOR
-            dest.blit(im_blockimg, im_blockimg.get_rect(**{anchor: (x, y)}))
+            output[s_blocklabel] = im_blockimg, im_blockimg.get_rect(**{anchor: ((x + dx) * i_zoom, (y + dy) * i_zoom)})
+        return output
+
+    def draw_blocks(self, dest: pygame.Surface) -> None:
+        """ Renders all blocks in current level.
+        """
+        self.renderer.blit_batch(dest, list(self.block_frames().values()))
+
+    def block_is_animating(self, s_blocklabel: str) -> bool:
+        """ Returns true if a block is mid-flip (or about to flip); false if it's at rest.
+        """
+        f_old: float = self.interface.block_get_scale_old(s_blocklabel)
+        return f_old != 1.0 or f_old != self.interface.block_get_scale_new(s_blocklabel)
+
+    def scene_layers(self, d_frames: Dict[str, Tuple[pygame.Surface, pygame.Rect]], b_build: bool = True) -> Tuple[pygame.Surface, List[Tuple[pygame.Surface, pygame.Rect]]]:
+        """ Splits this frame's blocks into the static layer (a cached composite of the background and every
+            block at rest) and the animating blocks that are drawn over it.
+            The static layer is recomposited only when the background, the target or one of its blocks changes.
+            With `b_build` false, a stale layer isn't rebuilt: (None, every block) is returned instead, so a frame
+            that is repainted anyway (e.g. while dragging) doesn't pay for compositing twice.
+            Unless Level.STATIC_LAYER is set, there's never a layer and every block is returned.
+        """
+        if not Level.STATIC_LAYER:
+            return None, list(d_frames.values())
+        d_static: Dict[str, Tuple[pygame.Surface, pygame.Rect]] = {}
+        l_dynamic: List[Tuple[pygame.Surface, pygame.Rect]] = []
+        for s_blocklabel, t_frame in d_frames.items():
+            if self.block_is_animating(s_blocklabel):
+                l_dynamic.append(t_frame)
+            else:
+                d_static[s_blocklabel] = t_frame
+        dest: pygame.Surface = self.renderer.target
+        t_state: tuple = (self.background_state(), dest.get_size(), self.renderer.zoom)
+        if self.scene_layer is None or t_state != self.scene_state or d_static != self.scene_static:
+            if not b_build:
+                self.scene_state = ()
+                return None, list(d_frames.values())
+            if self.scene_layer is None or self.scene_layer.get_size() != dest.get_size():
+                self.scene_layer = pygame.Surface(dest.get_size(), 0, dest)
+            self.draw_background(self.scene_layer)
+            self.renderer.blit_batch(self.scene_layer, list(d_static.values()))
+            self.scene_static = d_static
+            self.scene_state = t_state
+        return self.scene_layer, l_dynamic
+
+    def dirty_rects(self, d_frames: Dict[str, Tuple[pygame.Surface, pygame.Rect]]) -> List[pygame.Rect]:
+        """ Returns the old and new rects of every block whose image, scale or position changed since last frame.
+        """
+        output: List[pygame.Rect] = []
+        for s_blocklabel in d_frames.keys() | self.frame_blocks.keys():
+            t_old = self.frame_blocks.get(s_blocklabel)
+            t_new = d_frames.get(s_blocklabel)
+            if t_old is None or t_new is None or t_old[0] is not t_new[0] or t_old[1] != t_new[1]:
+                output.extend(t[1] for t in (t_old, t_new) if t is not None)
+        return output
 
     def render(self, dt: float) -> None:
         """ Once-per-frame render method.
+            Frames are composited from the background (or the static layer) plus the blocks and the cursor. Only regions
+            that changed are redrawn and pushed to the display; the whole frame is repainted when the
+            background changes, the field is dragged or the window rescales.
         """
-        dest = self.renderer.internal
-        self.draw_background(dest)
+        dest = self.renderer.target
+        profiler = self.renderer.profiler
         self.animate_blocks(dt)
-        self.draw_blocks(dest)
-        self.renderer.render_cursor(dest)
-        self.renderer.flip()
+        profiler.mark("animate")
+        d_frames = self.block_frames()
+        t_state: tuple = (
+              self.background_state(),
+              tuple(self.interface.field_position),
+              self.renderer.window_size,
+              self.renderer.mode,
+              profiler.overlay
+        )
+        l_dirty: List[pygame.Rect] = self.dirty_rects(d_frames) if t_state == self.frame_state else []
+        self.frame_blocks = d_frames
+        profiler.mark("blocks")
+        if t_state != self.frame_state or len(l_dirty) > Level.DIRTY_LIMIT:
+            self.frame_state = t_state
+            layer, l_blits = self.scene_layers(d_frames, False)
+            if layer is None:
+                self.draw_background(dest)
+            else:
+                dest.blit(layer, (0, 0))
+            profiler.mark("background")
+            self.renderer.blit_batch(dest, l_blits)
+            profiler.mark("blocks")
+            self.renderer.render_cursor(dest)
+            if profiler.overlay:
+                profiler.draw(dest)
+            self.renderer.flip()
+            profiler.end()
+            return
+
+        rect_cursor: pygame.Rect = self.renderer.cursor_rect
+        if rect_cursor != self.renderer.cursor_target():
+            l_dirty.append(rect_cursor)
+        if profiler.overlay:
+            l_dirty.append(profiler.overlay_rect)
+        if l_dirty:
+            layer, l_dynamic = self.scene_layers(d_frames)
+            profiler.mark("background")
+            for rect in l_dirty:
+                dest.set_clip(rect)
+                if layer is None:
+                    self.draw_background(dest)
+                else:
+                    dest.blit(layer, (0, 0))
+                profiler.mark("background")
+                self.renderer.blit_batch(dest, [t for t in l_dynamic if t[1].colliderect(rect)])
+                profiler.mark("blocks")
+            dest.set_clip(None)
+        l_dirty.append(self.renderer.render_cursor(dest))
+        if profiler.overlay:
+            l_dirty.append(profiler.draw(dest))
+        self.renderer.flip(l_dirty)
+        profiler.end()
 
     def reset(self):
         if not self.system.is_solved() and not self.scale_changing:
@@ -272,12 +376,24 @@ class Level:
             self.scale_changing = 1.0
             self.is_resetting = True
 
+    def is_idle(self) -> bool:
+        """ Returns true if nothing is animating or being dragged; false otherwise.
+        """
+        return bool(Level.IDLE_TIMEOUT) and not self.scale_changing and not self.interface.mouse_down
+
     def update(self) -> float:
         """ Once-per-frame update method.
+            While idle, this blocks until input arrives (or IDLE_TIMEOUT passes) instead of ticking at full rate.
         """
-        dt: float = self.renderer.tick() / 1000.0
+        if self.is_idle():
+            dt: float = 0.0
+            events: list = self.renderer.wait(Level.IDLE_TIMEOUT)
+        else:
+            dt: float = self.renderer.tick() / 1000.0
+            events: list = pygame.event.get()
+        self.renderer.profiler.begin()
 
-        for e in pygame.event.get():
+        for e in events:
             if e.type == pygame.QUIT:
                 self.renderer.quit()
             elif e.type == pygame.KEYDOWN:
@@ -285,6 +401,8 @@ class Level:
                     self.renderer.quit()
                 elif e.key == pygame.K_r:
                     self.reset()
+                elif e.key == pygame.K_F3:
+                    self.renderer.profiler.toggle_overlay()
             elif e.type == pygame.MOUSEBUTTONDOWN:
                 self.interface.mouse_down = True
             elif e.type == pygame.MOUSEBUTTONUP:
@@ -302,13 +420,18 @@ class Level:
                     self.interface.field_position[0] += dx
                     self.interface.field_position[1] += dy
 
+        self.renderer.profiler.mark("events")
         return dt
 
 
 
 if __name__ == "__main__":
+    # Usage: python -m src.level [TRACE.csv | TRACE.json]  (F3 toggles the frame timing overlay)
+    ImageCache.SHARED.disk = SpriteCache()
     c = RenderContext()
     l = Level(c)
+    if len(sys.argv) > 1:
+        l.renderer.profiler.dump_on_exit(sys.argv[1])
     l.load_from_script("../res/DUMMY_2.CCP")
     while True:
         dt: float = l.update()
@@ -1,11 +1,19 @@
 #! usr/bin/env python3
 import pygame
 from uuid import uuid4
-from typing import Dict, List
+from typing import Dict, List, Set, Tuple
+from src.image_cache import ImageCache
+from src.texture_atlas import TextureAtlas
 from src.utility_image import ImageUtil
 
 
 class LevelImage:
+    # Shared asset libraries (by name), loaded once per process and never cleared
+    LIBRARIES: Dict[str, "LevelImage"] = {}
+
+    # Flip-animation scales are quantized to this many steps (one per pixel row for 32px blocks)
+    FLIP_STEPS: int = 32
+
     __slots__ = [
         "image_entity",
         "image_index",
@@ -13,6 +21,12 @@ class LevelImage:
         "image_key",
         "image_dims",
         "image_cache",
+        "image_library",
+        "image_atlas",
+        "image_owned",
+        "image_frames",
+        "image_display",
+        "image_generation",
         "palette",
         "font",
         "font_cache"
@@ -25,6 +39,12 @@ class LevelImage:
         self.image_value: Dict[str, str] = {}
         self.image_dims: Dict[str, List[int, int]] = {}
         self.image_cache: Dict[str, pygame.Surface] = {}
+        self.image_library: Dict[str, LevelImage] = {}
+        self.image_atlas: TextureAtlas = None
+        self.image_owned: Set[str] = set()
+        self.image_frames: Dict[Tuple[str, int, int], pygame.Surface] = {}
+        self.image_display: Dict[Tuple[str, int, int], pygame.Surface] = {}
+        self.image_generation: int = ImageUtil.DISPLAY_GENERATION
         self.palette: Dict[int, List[int]] = ImageUtil.new_palette(
               ImageUtil.DEFAULT_PALETTE_0,
               ImageUtil.DEFAULT_PALETTE_1,
@@ -43,6 +63,11 @@ class LevelImage:
         self.image_value.clear()
         self.image_dims.clear()
         self.image_cache.clear()
+        self.image_library.clear()
+        self.image_atlas = None
+        self.image_owned.clear()
+        self.image_frames.clear()
+        self.image_display.clear()
         self.font.clear()
         self.font_cache.clear()
 
@@ -96,16 +121,127 @@ class LevelImage:
         s_image: str = self.image_entity[s_label]
         self.image_value[s_image] = s_value
         self.image_dims[s_image] = [i_w, i_h]
+        self.image_cache.pop(s_label, None)
+        self.image_library.pop(s_label, None)
+        self.image_owned.discard(s_label)
+        for d_frames in (self.image_frames, self.image_display):
+            for t_frame in [x for x in d_frames if x[0] == s_label]:
+                del d_frames[t_frame]
+
+    def image_import(self, library: "LevelImage"):
+        """ Makes every image and key of a shared library available under the same labels.
+            Decoded surfaces are borrowed from the library rather than decoded again.
+        """
+        self.image_key.update(library.image_key)
+        self.image_entity.update(library.image_entity)
+        self.image_value.update(library.image_value)
+        self.image_dims.update(library.image_dims)
+        for s_key, d_index in library.image_index.items():
+            self.image_index[s_key] = dict(d_index)
+        for s_label in library.image_entity:
+            self.image_library[s_label] = library.image_library.get(s_label, library)
+
+    def image_decode(self, s_imglabel: str) -> pygame.Surface:
+        """ Returns the decoded surface for an image label, decoding it on first use.
+            Decoded surfaces come from the process-wide ImageCache, so they may be shared with other levels.
+        """
+        try:
+            return self.image_cache[s_imglabel]
+        except KeyError:
+            library: LevelImage = self.image_library.get(s_imglabel)
+            if library is not None and library.palette == self.palette:
+                self.image_cache[s_imglabel] = library.image_decode(s_imglabel)
+            else:
+                i_w, i_h = self.image_get_dims(s_imglabel)
+                s_image: str = self.image_get_value(s_imglabel)
+                self.image_cache[s_imglabel] = ImageCache.SHARED.get(s_image, self.palette, i_w, i_h)
+            return self.image_cache[s_imglabel]
+
+    def image_set_palette(self, palette: Dict[int, List[int]]):
+        """ Recolors every decoded image in place; surfaces are palettized, so nothing is decoded again.
+            Shared surfaces (from a library or the ImageCache) are copied first, so nobody else is recolored.
+        """
+        self.palette = palette
+        self.image_frames.clear()
+        self.image_display.clear()
+        l_colors: List[List[int]] = ImageUtil.palette_colors(palette)
+        if self.image_atlas:
+            self.image_atlas.set_palette(palette)
+        for s_label in list(self.image_cache.keys()):
+            surface: pygame.Surface = self.image_cache[s_label]
+            if s_label not in self.image_owned and not (self.image_atlas and surface.get_parent() is self.image_atlas.surface):
+                surface = self.image_cache[s_label] = surface.copy()
+                self.image_library.pop(s_label, None)
+                self.image_owned.add(s_label)
+            surface.set_palette(l_colors)
+
+    def image_pack(self, atlas: TextureAtlas = None) -> TextureAtlas:
+        """ Packs this interface's own images into one atlas and serves them as its subsurfaces from then on.
+            A prebuilt `atlas` (e.g. one loaded from disk) is reused if every image's content key matches.
+            Images borrowed from a library are left alone; the library packs its own.
+        """
+        d_keys: Dict[str, str] = {}
+        for s_label in self.image_entity:
+            s_value: str = self.image_get_value(s_label)
+            if s_label not in self.image_library and s_value is not None:
+                d_keys[s_label] = TextureAtlas.key(s_value, *self.image_get_dims(s_label))
+        if atlas is None or any(atlas.keys.get(k) != v for k, v in d_keys.items()):
+            atlas = TextureAtlas.build({k: self.image_decode(k) for k in d_keys}, self.palette, d_keys)
+        else:
+            atlas.set_palette(self.palette)
+        for s_label in d_keys:
+            self.image_cache[s_label] = atlas.get(s_label)
+        self.image_atlas = atlas
+        self.image_frames.clear()
+        self.image_display.clear()
+        return atlas
+
+    def image_preload(self):
+        """ Decodes every image up front, so no decode happens on a later frame.
+        """
+        for s_label in list(self.image_entity.keys()):
+            self.image_decode(s_label)
 
     def image_get(self, s_label: str, i_index: int) -> pygame.Surface:
         """ Returns a string image given its key and index.
         """
         s_key: str = self.image_get_key(s_label)
         s_imglabel: str = self.image_get_label(s_key, i_index)
+        return self.image_decode(s_imglabel)
+
+    def image_get_scaled(self, s_label: str, i_index: int, f_scale: float, i_zoom: int = 1) -> pygame.Surface:
+        """ Returns an image squashed vertically to `f_scale` of its height, for the flip animation,
+            and enlarged `i_zoom` times for drawing at window resolution.
+            The scale is quantized to FLIP_STEPS and each (step, zoom) is scaled once; full scale is the image itself.
+        """
+        s_imglabel: str = self.image_get_label(self.image_get_key(s_label), i_index)
+        i_step: int = min(int(round(f_scale * LevelImage.FLIP_STEPS)), LevelImage.FLIP_STEPS)
+        if i_step == LevelImage.FLIP_STEPS and i_zoom == 1:
+            return self.image_decode(s_imglabel)
         try:
-            return self.image_cache[s_imglabel]
+            return self.image_frames[s_imglabel, i_step, i_zoom]
         except KeyError:
-            i_w, i_h = self.image_get_dims(s_imglabel)
-            s_image: str = self.image_get_value(s_imglabel)
-            self.image_cache[s_imglabel] = ImageUtil.convert_image(s_image, self.palette, i_w, i_h)
-            return self.image_cache[s_imglabel]
+            surface: pygame.Surface = self.image_decode(s_imglabel)
+            w, h = surface.get_size()
+            frame: pygame.Surface = pygame.transform.scale(surface, (w * i_zoom, int(round(h * i_step / LevelImage.FLIP_STEPS)) * i_zoom))
+            self.image_frames[s_imglabel, i_step, i_zoom] = frame
+            return frame
+
+    def image_get_display(self, s_label: str, i_index: int, f_scale: float, i_zoom: int = 1) -> pygame.Surface:
+        """ Same as `image_get_scaled`, but converted once to the display's pixel format (see ImageUtil.display_format).
+            The palettized images stay the source of truth: a palette swap just drops the converted copies,
+            and so does reopening the display. Without a display nothing is converted, so nothing is kept.
+        """
+        if pygame.display.get_surface() is None:
+            return self.image_get_scaled(s_label, i_index, f_scale, i_zoom)
+        if self.image_generation != ImageUtil.DISPLAY_GENERATION:
+            self.image_display.clear()
+            self.image_generation = ImageUtil.DISPLAY_GENERATION
+        s_imglabel: str = self.image_get_label(self.image_get_key(s_label), i_index)
+        i_step: int = min(int(round(f_scale * LevelImage.FLIP_STEPS)), LevelImage.FLIP_STEPS)
+        try:
+            return self.image_display[s_imglabel, i_step, i_zoom]
+        except KeyError:
+            frame: pygame.Surface = ImageUtil.display_format(self.image_get_scaled(s_label, i_index, f_scale, i_zoom))
+            self.image_display[s_imglabel, i_step, i_zoom] = frame
+            return frame
@@ -0,0 +1,83 @@
+#! usr/bin/env python3
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, List, Tuple
+from src.block_system import BlockSystem
+from src.level import Level
+from src.level_image import LevelImage
+from src.level_interface import LevelInterface
+from src.level_pack import LevelPack
+
+
+class LevelLoader:
+    """ Prepares upcoming levels on a worker thread: parses them, builds their systems and
+        decodes their images. The main loop then swaps a finished level in with `Level.swap`.
+    """
+
+    DEPTH: int = 2
+
+    __slots__ = [
+        "queue",
+        "pending",
+        "pack",
+        "depth",
+        "executor"
+    ]
+
+    def __init__(self, levels: List[str], depth: int = DEPTH, *, pack: LevelPack = None):
+        self.queue: Deque[str] = deque(levels)
+        self.pending: Deque[Tuple[str, Future]] = deque()
+        self.pack: LevelPack = pack
+        self.depth: int = depth
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="LevelLoader")
+        self.prefetch()
+
+    def __bool__(self) -> bool:
+        """ Returns true while there's a level left for `next`; false once the loader is exhausted.
+        """
+        return bool(self.queue or self.pending)
+
+    def prepare(self, s_level: str) -> Tuple[BlockSystem, LevelInterface, LevelImage]:
+        """ Fully loads a level off to the side. Runs on the worker thread.
+        """
+        s, i, im = BlockSystem(), LevelInterface(), LevelImage()
+        if self.pack:
+            Level.from_pack(s, i, im, self.pack, s_level)
+        else:
+            Level.from_script(s, i, im, s_level)
+        im.image_preload()
+        return s, i, im
+
+    def prefetch(self) -> None:
+        """ Keeps up to `depth` upcoming levels in flight.
+        """
+        while self.queue and len(self.pending) < self.depth:
+            s_level: str = self.queue.popleft()
+            self.pending.append((s_level, self.executor.submit(self.prepare, s_level)))
+
+    def ready(self) -> bool:
+        """ Returns true if the next level has finished loading; false otherwise.
+        """
+        return bool(self.pending) and self.pending[0][1].done()
+
+    def next(self, level: Level) -> str:
+        """ Swaps the next level into `level`, waiting for it only if it isn't ready yet.
+            Returns the name of the level swapped in. Check the loader's truth value first;
+            calling this on an exhausted loader raises an IndexError.
+        """
+        self.prefetch()
+        if not self.pending:
+            raise IndexError("No levels left to load")
+        s_level, future = self.pending.popleft()
+        level.swap(*future.result())
+        self.prefetch()
+        return s_level
+
+    def shutdown(self) -> None:
+        """ Stops the worker thread, discarding levels that haven't started loading.
+        """
+        self.queue.clear()
+        for _, future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.executor.shutdown(wait=True)
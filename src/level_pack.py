@@ -0,0 +1,171 @@
+#! usr/bin/env python3
+import codecs
+import hashlib
+import mmap
+import os
+import re
+import struct
+import sys
+from typing import Dict, Iterator, List, Tuple
+from src.utility import ScriptParser
+from src.utility_image import ImageUtil
+
+
+class LevelPack:
+    """ Read-only container holding many level scripts in one memory-mapped file.
+        Layout: a fixed header, an index of name -> (offset, length, content hash), then the raw scripts.
+        Opening a pack only reads the index; a level's bytes are touched only when it's loaded.
+    """
+
+    MAGIC: bytes = b"CCPK"
+    VERSION: int = 1
+    HEADER = struct.Struct("<4sHI")  # Magic, version, number of levels
+    ENTRY = struct.Struct("<HQQ20s")  # Name length, offset, length, SHA-1
+    ENCODING: str = "utf-8"
+    SETVALUE = re.compile(r"(\[\s*IMAGE\s+SETVALUE\s*]\s*<\s*\S+\s+)(\S+)(\s+\d+\s+\d+\s*>)", re.IGNORECASE)
+
+    __slots__ = [
+        "filename",
+        "index",
+        "_file",
+        "_map"
+    ]
+
+    def __init__(self, filename: str):
+        self.filename: str = filename
+        self.index: Dict[str, Tuple[int, int, bytes]] = {}
+        self._file = open(filename, "rb")
+        self._map: mmap.mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._read_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __contains__(self, s_name: str) -> bool:
+        return s_name in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def names(self) -> List[str]:
+        """ Level names in pack order.
+        """
+        return list(self.index.keys())
+
+    @staticmethod
+    def build(filename: str, d_levels: Dict[str, bytes]):
+        """ Writes a new pack from a mapping of level name -> script bytes. Order is preserved.
+        """
+        l_names: List[str] = list(d_levels.keys())
+        i_offset: int = LevelPack.HEADER.size
+        for s_name in l_names:
+            i_offset += LevelPack.ENTRY.size + len(s_name.encode(LevelPack.ENCODING))
+
+        with open(filename, "wb") as f:
+            f.write(LevelPack.HEADER.pack(LevelPack.MAGIC, LevelPack.VERSION, len(l_names)))
+            for s_name in l_names:
+                b_name: bytes = s_name.encode(LevelPack.ENCODING)
+                b_level: bytes = d_levels[s_name]
+                f.write(LevelPack.ENTRY.pack(len(b_name), i_offset, len(b_level), hashlib.sha1(b_level).digest()))
+                f.write(b_name)
+                i_offset += len(b_level)
+            for s_name in l_names:
+                f.write(d_levels[s_name])
+
+    @staticmethod
+    def build_from_files(filename: str, l_filenames: List[str], *, binary_images: bool = False):
+        """ Writes a new pack from script files. Levels are named after their file, sans extension.
+            With `binary_images`, image strings are compiled to binary payloads on the way in.
+        """
+        d_levels: Dict[str, bytes] = {}
+        for s_filename in l_filenames:
+            s_name: str = os.path.splitext(os.path.basename(s_filename))[0]
+            with open(s_filename, "rb") as f:
+                d_levels[s_name] = f.read()
+            if binary_images:
+                d_levels[s_name] = LevelPack.compile_images(d_levels[s_name])
+        LevelPack.build(filename, d_levels)
+
+    @staticmethod
+    def compile_images(b_level: bytes) -> bytes:
+        """ Rewrites every text-format `[IMAGE SETVALUE]` payload of a script as a binary payload.
+        """
+        def compile_one(r) -> str:
+            s_value: str = r.group(2)
+            if not ImageUtil.is_binary(s_value):
+                s_value = ImageUtil.to_binary(s_value)
+            return r.group(1) + s_value + r.group(3)
+
+        s_level: str = b_level.decode(LevelPack.ENCODING)
+        return LevelPack.SETVALUE.sub(compile_one, s_level).encode(LevelPack.ENCODING)
+
+    def close(self):
+        """ Releases the memory map and file handle.
+            Views from `get_bytes` must be released (and `stream` generators finished or closed) first;
+            otherwise the map is still exported and this raises a BufferError. Copy with bytes() to keep data.
+        """
+        self._map.close()
+        self._file.close()
+
+    def get_bytes(self, s_name: str) -> memoryview:
+        """ Returns a zero-copy view of a level's raw script bytes.
+        """
+        i_offset, i_length, _ = self.index[s_name]
+        return memoryview(self._map)[i_offset:i_offset + i_length]
+
+    def get_hash(self, s_name: str) -> str:
+        """ Returns the stored content hash of a level (hex).
+        """
+        return self.index[s_name][2].hex()
+
+    def stream(self, s_name: str, chunk_size: int = ScriptParser.CHUNK_SIZE) -> Iterator[Tuple[Tuple[str], Tuple[str], int]]:
+        """ Yields a level's statements, decoding its bytes one chunk at a time.
+            A truncated multi-byte character at the end of a level raises a UnicodeDecodeError.
+        """
+        mv: memoryview = self.get_bytes(s_name)
+        try:
+            yield from ScriptParser.stream_chunks(LevelPack._decode(mv, chunk_size))
+        finally:
+            mv.release()
+
+    @staticmethod
+    def _decode(mv: memoryview, chunk_size: int) -> Iterator[str]:
+        """ Decodes a view one chunk at a time; multi-byte characters may straddle chunks.
+        """
+        decoder = codecs.getincrementaldecoder(LevelPack.ENCODING)()
+        for n in range(0, len(mv), chunk_size):
+            yield decoder.decode(mv[n:n + chunk_size])
+        yield decoder.decode(b"", final=True)
+
+    def verify(self, s_name: str) -> bool:
+        """ Returns true if a level's bytes match its stored content hash; false otherwise.
+        """
+        mv: memoryview = self.get_bytes(s_name)
+        try:
+            return hashlib.sha1(mv).digest() == self.index[s_name][2]
+        finally:
+            mv.release()
+
+    def _read_index(self):
+        """ Reads the header index (and nothing else).
+        """
+        s_magic, i_version, i_count = LevelPack.HEADER.unpack_from(self._map, 0)
+        if s_magic != LevelPack.MAGIC or i_version != LevelPack.VERSION:
+            raise ValueError("Not a level pack: {}".format(self.filename))
+        i_cursor: int = LevelPack.HEADER.size
+        for _ in range(i_count):
+            i_namelen, i_offset, i_length, b_hash = LevelPack.ENTRY.unpack_from(self._map, i_cursor)
+            i_cursor += LevelPack.ENTRY.size
+            s_name: str = bytes(self._map[i_cursor:i_cursor + i_namelen]).decode(LevelPack.ENCODING)
+            i_cursor += i_namelen
+            self.index[s_name] = (i_offset, i_length, b_hash)
+
+
+if __name__ == "__main__":
+    # Usage: python -m src.level_pack [--binary] OUTPUT.CCPK LEVEL.CCP [LEVEL.CCP ...]
+    l_args: List[str] = [x for x in sys.argv[1:] if x != "--binary"]
+    LevelPack.build_from_files(l_args[0], l_args[1:], binary_images="--binary" in sys.argv)
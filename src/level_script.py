@@ -0,0 +1,221 @@
+#! usr/bin/env python3
+import threading
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from src.block_system import BlockSystem
+from src.level_image import LevelImage
+from src.level_interface import LevelInterface
+from src.utility import ScriptError, ScriptParser, Utility
+
+
+class LevelScript:
+    """ Table-driven interpreter for level script statements.
+        Each opcode (a normalized header tuple) maps to a handler and the converters for its parameters.
+    """
+
+    # Header family -> which of (system, interface, images) a handler is bound to
+    FAMILIES: Tuple[str, ...] = ("SYSTEM", "INTERFACE", "IMAGE")
+
+    OPCODES: Dict[Tuple[str, ...], Tuple[str, Callable, Tuple[Callable, ...]]] = {}
+
+    # Opcode -> number of leading params identifying what a statement overwrites.
+    # Only these statements may be re-applied in place; everything else is additive.
+    KEYS: Dict[Tuple[str, ...], int] = {}
+
+    # Shared asset libraries, each section introduced by a `[LIBRARY] <name>!` statement
+    ASSET_FILE: str = Utility.abspath(__file__, "../res/ASSETS.CCP")
+    LIBRARY_HEADER: Tuple[str, ...] = ("LIBRARY",)
+    LIBRARY_LOCK: threading.RLock = threading.RLock()
+    ASSETS_LOADED: Set[str] = set()
+
+    @classmethod
+    def register(cls, t_header: Tuple[str, ...], f_handler: Callable, *converters: Callable, key: int = 0):
+        """ Registers a handler for an opcode. Handlers are unbound methods of the family's target class.
+            Parameters are passed through their converters positionally; a converter of `tuple`
+            consumes all remaining parameters as a single argument.
+            A nonzero `key` marks the opcode as a setter whose first `key` params name its target.
+        """
+        t_opcode: Tuple[str, ...] = cls.normalize(t_header)
+        if t_opcode[0] not in cls.FAMILIES:
+            raise ValueError("Unknown opcode family: {}".format(" ".join(t_opcode)))
+        cls.OPCODES[t_opcode] = (t_opcode[0], f_handler, converters)
+        if key:
+            cls.KEYS[t_opcode] = key
+
+    @staticmethod
+    def normalize(t_header: Tuple[str, ...]) -> Tuple[str, ...]:
+        """ Returns the canonical (lookup) form of a statement header.
+        """
+        return tuple(x.upper() for x in t_header)
+
+    @staticmethod
+    def convert(converters: Tuple[Callable, ...], t_params: Tuple[str, ...]) -> list:
+        """ Applies declared converters to a statement's parameters.
+        """
+        l_args: list = []
+        for i_num, f_convert in enumerate(converters):
+            if f_convert is tuple:
+                l_args.append(tuple(t_params[i_num:]))
+                break
+            l_args.append(f_convert(t_params[i_num]))
+        return l_args
+
+    @staticmethod
+    def targets(
+          s: BlockSystem,
+          i: LevelInterface,
+          im: LevelImage,
+          *,
+          headless=False
+    ) -> Dict[str, object]:
+        """ Returns the objects each opcode family is applied to. Headless loads have no image target.
+        """
+        d_targets: Dict[str, object] = {"SYSTEM": s, "INTERFACE": i}
+        if not headless:
+            d_targets["IMAGE"] = im
+        return d_targets
+
+    @classmethod
+    def execute(cls, d_targets: Dict[str, object], t_header: Tuple[str, ...], t_params: Tuple[str, ...]):
+        """ Interprets a single statement against the given targets. Unknown opcodes are ignored.
+        """
+        try:
+            s_family, f_handler, converters = cls.OPCODES[cls.normalize(t_header)]
+            target = d_targets[s_family]
+        except KeyError:
+            return
+        f_handler(target, *cls.convert(converters, t_params))
+
+    @classmethod
+    def interpret(
+          cls,
+          s: BlockSystem,
+          i: LevelInterface,
+          im: LevelImage,
+          statements: Iterable[Tuple[Tuple[str, ...], Tuple[str, ...], int]],
+          *,
+          headless=False,
+          filename: str = "<script>"
+    ):
+        """ Interprets a sequence of (header, params, line number) statements in order.
+            Statements are consumed lazily, so a streaming parser can still be reading the file.
+        """
+        d_targets: Dict[str, object] = cls.targets(s, i, im, headless=headless)
+        for t_header, t_params, i_line in statements:
+            try:
+                cls.execute(d_targets, t_header, t_params)
+            except (KeyError, IndexError, ValueError, TypeError, AttributeError) as e:
+                raise ScriptError(filename, i_line, "[{}] {!r}".format(" ".join(t_header), e)) from e
+
+    @classmethod
+    def target(cls, t_header: Tuple[str, ...], t_params: Tuple[str, ...]) -> Optional[Tuple]:
+        """ Returns what a setter statement overwrites, or None if the statement is additive.
+        """
+        t_opcode: Tuple[str, ...] = cls.normalize(t_header)
+        i_key: int = cls.KEYS.get(t_opcode, 0)
+        if not i_key:
+            return None
+        return t_opcode, tuple(t_params[:i_key])
+
+    @classmethod
+    def diff(
+          cls,
+          l_old: List[Tuple[Tuple[str, ...], Tuple[str, ...], int]],
+          l_new: List[Tuple[Tuple[str, ...], Tuple[str, ...], int]]
+    ) -> Optional[List[Tuple[Tuple[str, ...], Tuple[str, ...], int]]]:
+        """ Returns the statements of `l_new` that must be re-applied on top of a level loaded from `l_old`,
+            in script order. Returns None if the change can't be applied in place (i.e. something additive
+            was removed, or a setter's target lost every statement), in which case a full reload is needed.
+        """
+        c_old: Counter = Counter((cls.normalize(h), p) for h, p, _ in l_old)
+        c_new: Counter = Counter((cls.normalize(h), p) for h, p, _ in l_new)
+        c_added: Counter = c_new - c_old
+        st_targets: Set[Tuple] = {cls.target(h, p) for h, p in c_new}
+        st_touched: Set[Tuple] = set()
+        for t_header, t_params in (c_old - c_new):
+            t_target = cls.target(t_header, t_params)
+            if t_target is None or t_target not in st_targets:
+                return None
+            st_touched.add(t_target)
+        for t_header, t_params in c_added:
+            st_touched.add(cls.target(t_header, t_params))
+        st_touched.discard(None)
+
+        # Every statement sharing a touched target is replayed, so the last write still wins
+        output: List[Tuple[Tuple[str, ...], Tuple[str, ...], int]] = []
+        for t_header, t_params, i_line in l_new:
+            t_statement = (cls.normalize(t_header), t_params)
+            if c_added[t_statement] > 0:
+                c_added[t_statement] -= 1
+                output.append((t_header, t_params, i_line))
+            elif cls.target(t_header, t_params) in st_touched:
+                output.append((t_header, t_params, i_line))
+        return output
+
+    @classmethod
+    def load_assets(cls, filename: str):
+        """ Interprets every library section of an asset file, then publishes them to `LevelImage.LIBRARIES`
+            in one step. Only IMAGE statements are meaningful within a library. Each library is fully decoded
+            first. Libraries already published are kept as they are, so levels importing them
+            keep sharing their surfaces.
+        """
+        d_libraries: Dict[str, LevelImage] = {}
+        d_targets: Dict[str, object] = {}
+        for t_header, t_params, i_line in ScriptParser.stream(filename):
+            if cls.normalize(t_header) == cls.LIBRARY_HEADER:
+                d_libraries[t_params[0]] = LevelImage()
+                d_targets = {"IMAGE": d_libraries[t_params[0]]}
+                continue
+            try:
+                cls.execute(d_targets, t_header, t_params)
+            except (KeyError, IndexError, ValueError, TypeError, AttributeError) as e:
+                raise ScriptError(filename, i_line, "[{}] {!r}".format(" ".join(t_header), e)) from e
+        for library in d_libraries.values():
+            library.image_preload()
+        with cls.LIBRARY_LOCK:
+            LevelImage.LIBRARIES.update({k: v for k, v in d_libraries.items() if k not in LevelImage.LIBRARIES})
+            cls.ASSETS_LOADED.add(filename)
+
+    @classmethod
+    def library(cls, s_name: str) -> LevelImage:
+        """ Returns a shared asset library by name, reading the asset file on first use.
+            Safe to call from a loader thread; an unknown name raises a ScriptError.
+        """
+        with cls.LIBRARY_LOCK:
+            if s_name not in LevelImage.LIBRARIES and cls.ASSET_FILE not in cls.ASSETS_LOADED:
+                cls.load_assets(cls.ASSET_FILE)
+            if s_name not in LevelImage.LIBRARIES:
+                raise ScriptError(cls.ASSET_FILE, 0, "Unknown library: {}".format(s_name))
+            return LevelImage.LIBRARIES[s_name]
+
+    @staticmethod
+    def image_import(im: LevelImage, s_name: str):
+        """ Handler for `[IMAGE IMPORT] <name>`.
+        """
+        im.image_import(LevelScript.library(s_name))
+
+
+# System
+LevelScript.register(("SYSTEM", "CYCLE", "ADD"), BlockSystem.cycle_add, str, tuple)
+LevelScript.register(("SYSTEM", "NODE", "CREATE"), BlockSystem.node_create, str)
+LevelScript.register(("SYSTEM", "NODE", "SETVALUE"), BlockSystem.node_set_value, str, str, key=1)
+LevelScript.register(("SYSTEM", "NODE", "SETCYCLE"), BlockSystem.node_set_cycle, str, str, key=1)
+LevelScript.register(("SYSTEM", "NODE", "SETIMMUNE"), BlockSystem.node_set_immune, str, Utility.stob, key=1)
+LevelScript.register(("SYSTEM", "NODE", "SETSTATIC"), BlockSystem.node_set_static, str, Utility.stob, key=1)
+LevelScript.register(("SYSTEM", "NODE", "SETTARGET"), BlockSystem.node_set_target, str, str, key=1)
+LevelScript.register(("SYSTEM", "NODE", "LINKSINGLE"), BlockSystem.node_link_single, str, str)
+LevelScript.register(("SYSTEM", "NODE", "LINKDOUBLE"), BlockSystem.node_link_double, str, str)
+
+# Interface
+LevelScript.register(("INTERFACE", "BLOCK", "CREATE"), LevelInterface.block_create, str)
+LevelScript.register(("INTERFACE", "BLOCK", "SETIMAGE"), LevelInterface.block_set_image, str, str, key=1)
+LevelScript.register(("INTERFACE", "BLOCK", "SETNODE"), LevelInterface.block_set_node, str, str)
+LevelScript.register(("INTERFACE", "BLOCK", "SETPOSITION"), LevelInterface.block_set_position, str, int, int, key=1)
+LevelScript.register(("INTERFACE", "BLOCK", "SETRECT"), LevelInterface.block_set_rect, str, int, int, int, int, key=1)
+
+# Image
+LevelScript.register(("IMAGE", "ADDIMAGE"), LevelImage.image_add, str)
+LevelScript.register(("IMAGE", "ADDKEY"), LevelImage.image_add_key, str)
+LevelScript.register(("IMAGE", "SETINDEX"), LevelImage.image_set_index, str, int, str, key=2)
+LevelScript.register(("IMAGE", "SETVALUE"), LevelImage.image_set_value, str, str, int, int, key=1)
+LevelScript.register(("IMAGE", "IMPORT"), LevelScript.image_import, str)
@@ -0,0 +1,143 @@
+#! usr/bin/env python3
+import os
+import sys
+import time
+from typing import Dict, List, Tuple
+from src.level import Level
+from src.render_context import RenderContext
+from src.level_script import LevelScript
+from src.utility import ScriptParser
+
+
+class LevelWatcher:
+    """ Hot-reloads a level script into a live Level whenever the file changes on disk.
+        Edits to setter statements are applied in place; anything else falls back to a full reload.
+        Either way, decoded images and solver answers that the edit didn't affect are kept.
+    """
+
+    INTERVAL: float = 0.25
+
+    __slots__ = [
+        "level",
+        "filename",
+        "interval",
+        "mtime",
+        "next_poll",
+        "statements",
+        "reloads",
+        "full_reloads"
+    ]
+
+    def __init__(self, level: Level, filename: str, interval: float = INTERVAL):
+        self.level: Level = level
+        self.filename: str = filename
+        self.interval: float = interval
+        self.mtime: int = 0
+        self.next_poll: float = 0.0
+        self.statements: List[Tuple[Tuple[str], Tuple[str], int]] = []
+        self.reloads: int = 0
+        self.full_reloads: int = 0
+
+    def read(self) -> List[Tuple[Tuple[str], Tuple[str], int]]:
+        """ Tokenizes the watched file (through the script cache, if enabled).
+        """
+        if Level.SCRIPT_CACHE:
+            return Level.SCRIPT_CACHE.statements(self.filename)
+        return list(ScriptParser.stream(self.filename))
+
+    def load(self) -> None:
+        """ Loads the watched file from scratch.
+        """
+        self.mtime = os.stat(self.filename).st_mtime_ns
+        self.statements = self.read()
+        self.level.clear()
+        LevelScript.interpret(
+              self.level.system,
+              self.level.interface,
+              self.level.images,
+              self.statements,
+              filename=self.filename
+        )
+        self.level.coordinate()
+
+    def poll(self) -> bool:
+        """ Checks the file's mtime (at most once per interval) and applies any changes.
+            Returns true if the level was updated; false otherwise.
+        """
+        f_now: float = time.monotonic()
+        if f_now < self.next_poll:
+            return False
+        self.next_poll = f_now + self.interval
+        try:
+            i_mtime: int = os.stat(self.filename).st_mtime_ns
+        except OSError:
+            return False
+        if i_mtime == self.mtime:
+            return False
+        self.mtime = i_mtime
+        return self.reload(self.read())
+
+    def reload(self, l_statements: List[Tuple[Tuple[str], Tuple[str], int]]) -> bool:
+        """ Applies a new statement list on top of the currently loaded one.
+            The solver's answers cover the whole block system, so any applied SYSTEM statement clears them;
+            INTERFACE and IMAGE edits keep them.
+        """
+        l_apply = LevelScript.diff(self.statements, l_statements)
+        if l_apply is None:
+            self._reload_full(l_statements)
+        elif not l_apply:
+            self.statements = l_statements
+            return False
+        else:
+            LevelScript.interpret(
+                  self.level.system,
+                  self.level.interface,
+                  self.level.images,
+                  l_apply,
+                  filename=self.filename
+            )
+            if any(LevelScript.normalize(h)[0] == "SYSTEM" for h, _, _ in l_apply):
+                self.level.system.answers.clear()
+        self.statements = l_statements
+        self.level.coordinate()
+        self.reloads += 1
+        return True
+
+    def _reload_full(self, l_statements: List[Tuple[Tuple[str], Tuple[str], int]]) -> None:
+        """ Rebuilds the level, carrying over unchanged decoded images and solver answers.
+        """
+        system, images = self.level.system, self.level.images
+        d_surfaces: Dict[str, Tuple] = {
+            s_label: (images.image_get_value(s_label), images.image_get_dims(s_label), surface)
+            for s_label, surface in images.image_cache.items()
+        }
+        d_answers: Dict[int, List[str]] = {}
+        if self._system(self.statements) == self._system(l_statements):
+            d_answers = {k: v[:] for k, v in system.answers.items()}
+
+        self.level.clear()
+        LevelScript.interpret(system, self.level.interface, images, l_statements, filename=self.filename)
+        system.answers.update(d_answers)
+        for s_label, (s_value, l_dims, surface) in d_surfaces.items():
+            if s_label in images.image_entity and images.image_get_value(s_label) == s_value:
+                if images.image_get_dims(s_label) == l_dims:
+                    images.image_cache[s_label] = surface
+        self.full_reloads += 1
+
+    @staticmethod
+    def _system(l_statements: List[Tuple[Tuple[str], Tuple[str], int]]) -> List[Tuple]:
+        """ Returns only the SYSTEM statements of a script, without line numbers.
+        """
+        return [(LevelScript.normalize(h), p) for h, p, _ in l_statements if LevelScript.normalize(h)[0] == "SYSTEM"]
+
+
+if __name__ == "__main__":
+    # Usage: python -m src.level_watch LEVEL.CCP
+    c = RenderContext()
+    l = Level(c)
+    w = LevelWatcher(l, sys.argv[1] if len(sys.argv) > 1 else "../res/DUMMY_2.CCP")
+    w.load()
+    while True:
+        dt: float = l.update()
+        w.poll()
+        l.render(dt)
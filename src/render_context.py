@@ -1,7 +1,10 @@
 #! usr/bin/env python3
 import pygame
+import numpy as np
 import os
-from typing import Tuple
+from typing import List, Tuple
+from src.background import Background
+from src.utility_image import ImageUtil
 
 os.environ["SDL_VIDEO_CENTERED"] = "1"
 
@@ -47,7 +50,7 @@ class RenderContext:
         self._scale_y: float = 0.0
         self._inv_scale_x: float = 0.0
         self._inv_scale_y: float = 0.0
-        self.external = pygame.display.set_mode(self.window_size, RenderContext.FLAGS, 32)
+        self.external = self.open_display()
         self.internal = pygame.Surface(self.screen_size)
         self.clock = pygame.time.Clock()
 
@@ -63,7 +66,7 @@ class RenderContext:
     def window_w(self, value: int):
         self._window_w = value
         old_external = self.external
-        self.external = pygame.display.set_mode(self.window_size, RenderContext.FLAGS, 32)
+        self.external = self.open_display()
         self.external.blit(old_external, (0, 0))
         del old_external
         self._update_scale_x()
@@ -77,7 +80,7 @@ class RenderContext:
     def window_h(self, value: int):
         self._window_h = value
         old_external = self.external
-        self.external = pygame.display.set_mode(self.window_size, RenderContext.FLAGS, 32)
+        self.external = self.open_display()
         self.external.blit(old_external, (0, 0))
         del old_external
         self._update_scale_y()
@@ -141,6 +144,29 @@ class RenderContext:
             self._update_inv_scale_y()
         return self._inv_scale_y
 
+    def open_display(self) -> pygame.Surface:
+        """ Opens (or resizes) the window and returns its surface.
+            Surfaces converted for the previous display are dropped, since its pixel format may have changed.
+        """
+        surface: pygame.Surface = pygame.display.set_mode(self.window_size, RenderContext.FLAGS, 32)
+        ImageUtil.display_changed()
+        Background.clear()
+        return surface
+
+    def present(self, rects: List[pygame.Rect] = None):
+        """ Pushes the external surface to the display; only `rects` (in window coordinates) if given.
+        """
+        if rects is not None:
+            pygame.display.update(rects)
+        else:
+            pygame.display.flip()
+
+    def mouse_pos(self) -> Tuple[int, int]:
+        return pygame.mouse.get_pos()
+
+    def mouse_visible(self, value: bool):
+        pygame.mouse.set_visible(value)
+
     def _update_scale_x(self, scale_x: float = 0.0):
         if not scale_x:
             scale_x: float = self.window_w / self.screen_w
@@ -169,3 +195,76 @@ class RenderContext:
 
     def tick(self) -> float:
         return self.clock.tick(RenderContext.FPS)
+
+    def wait(self, timeout: int) -> list:
+        """ Sleeps until an event arrives (or `timeout` ms pass) and returns every pending event.
+            The frame clock is restarted, so the time spent idle never shows up as a frame's delta.
+        """
+        e = pygame.event.wait(timeout)
+        events: list = [] if e.type == pygame.NOEVENT else [e] + pygame.event.get()
+        self.clock.tick()
+        return events
+
+
+class HeadlessRenderContext(RenderContext):
+    """ RenderContext that never opens a window: the external display is a plain Surface.
+        Runs on SDL's dummy video driver, so it works in CI and on machines without a display.
+        The clock is simulated (every tick is exactly one frame at FPS, with no sleeping) and the
+        mouse sits at `mouse` (window coordinates), so the same inputs always render the same frames.
+        Presented frames can be captured as arrays, kept in `frames`, or written out as a PNG sequence.
+    """
+
+    FRAME_NAME: str = "frame_{:05d}.png"
+
+    __slots__ = [
+        "mouse",
+        "frame_count",
+        "frames",
+        "keep_frames",
+        "capture_dir"
+    ]
+
+    def __init__(self, capture_dir: str = None, keep_frames: bool = False):
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        self.mouse: Tuple[int, int] = (0, 0)
+        self.frame_count: int = 0
+        self.frames: List[np.ndarray] = []
+        self.keep_frames: bool = keep_frames
+        self.capture_dir: str = capture_dir
+        if capture_dir:
+            os.makedirs(capture_dir, exist_ok=True)
+        super().__init__()
+
+    def open_display(self) -> pygame.Surface:
+        return pygame.Surface(self.window_size)
+
+    def present(self, rects: List[pygame.Rect] = None):
+        """ Counts the frame and, if enabled, records it to `frames` and/or `capture_dir`.
+        """
+        if self.keep_frames:
+            self.frames.append(self.capture())
+        if self.capture_dir:
+            self.save_frame(os.path.join(self.capture_dir, HeadlessRenderContext.FRAME_NAME.format(self.frame_count)))
+        self.frame_count += 1
+
+    def capture(self) -> np.ndarray:
+        """ Returns a copy of the external surface's pixels, shaped (w, h, 3) like pygame.surfarray.
+        """
+        return pygame.surfarray.array3d(self.external)
+
+    def save_frame(self, filename: str):
+        """ Writes the external surface to an image file (format chosen by extension).
+        """
+        pygame.image.save(self.external, filename)
+
+    def mouse_pos(self) -> Tuple[int, int]:
+        return self.mouse
+
+    def mouse_visible(self, value: bool):
+        pass
+
+    def tick(self) -> float:
+        return 1000.0 / RenderContext.FPS
+
+    def wait(self, timeout: int) -> list:
+        return pygame.event.get()
@@ -1,6 +1,8 @@
 #! usr/bin/env python3
 import pygame
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Tuple
+from src.frame_profiler import FrameProfiler
+from src.image_cache import ImageCache
 from src.render_context import RenderContext
 from src.utility_image import ImageUtil
 
@@ -11,18 +13,30 @@ class Renderer:
         RenderContext first.
     """
 
+    CURSOR: str = "a8b2fafbXX8eG2(0a,3)2xwg01(05,3)abxef08hMmtXqhMmtXqhMmtX8sb(af,3)b(XX,2)xf"
+    MODES: Tuple[str, ...] = ("nearest", "scale2x", "prescaled")
+    MODE: str = "nearest"
+
     __slots__ = [
         "_rects",
         "_images",
+        "_scaled",
+        "_generation",
+        "mode",
         "context",
         "palette",
-        "cursor"
+        "cursor",
+        "cursor_rect",
+        "profiler"
     ]
 
     def __init__(self, context: RenderContext):
         self.context: RenderContext = context
         self._rects: Dict[str, pygame.Rect] = {}
         self._images: Dict[str, pygame.Surface] = {}
+        self._scaled: Dict[Tuple[int, int], Tuple[pygame.Surface, pygame.Surface]] = {}
+        self._generation: int = ImageUtil.DISPLAY_GENERATION
+        self.mode: str = Renderer.MODE
         self.palette: Dict[int, List[int]] = ImageUtil.new_palette(
             ImageUtil.DEFAULT_PALETTE_0,
             ImageUtil.DEFAULT_PALETTE_1,
@@ -30,12 +44,11 @@ class Renderer:
             ImageUtil.DEFAULT_PALETTE_3
         )
 
-        pygame.mouse.set_visible(False)
+        context.mouse_visible(False)
 
-        s_image = "a8b2fafbXX8eG2(0a,3)2xwg01(05,3)abxef08hMmtXqhMmtXqhMmtX8sb(af,3)b(XX,2)xf"
-        i_image = ImageUtil.convert_image(s_image, self.palette, 16, 16)
-        i_image.set_colorkey(ImageUtil.DEFAULT_PALETTE_3)
-        self.cursor = i_image
+        self.cursor = ImageUtil.display_format(self.cursor_image())
+        self.cursor_rect: pygame.Rect = self.cursor.get_rect()
+        self.profiler: FrameProfiler = FrameProfiler()
 
     @property
     def internal(self) -> pygame.Surface:
@@ -73,6 +86,31 @@ class Renderer:
     def window_size(self) -> Tuple[int, int]:
         return self.context.window_size
 
+    @property
+    def integer_scale(self) -> int:
+        """ The window's scale if it's the same whole number on both axes; 0 otherwise.
+        """
+        sx, sy = float(self.scale_x), float(self.scale_y)
+        return int(sx) if sx == sy and sx.is_integer() and sx >= 1 else 0
+
+    @property
+    def zoom(self) -> int:
+        """ Factor sprites are pre-scaled by: the integer scale in "prescaled" mode, otherwise 1.
+        """
+        return self.integer_scale if self.mode == "prescaled" else 1
+
+    @property
+    def direct(self) -> bool:
+        """ True if frames are drawn straight to the window at its resolution (pre-scaled sprites).
+        """
+        return self.zoom > 1
+
+    @property
+    def target(self) -> pygame.Surface:
+        """ Surface frames are drawn to: the window when drawing directly, otherwise the internal display.
+        """
+        return self.context.external if self.direct else self.context.internal
+
     @property
     def screen_size(self) -> Tuple[int, int]:
         return self.context.screen_size
@@ -156,6 +194,26 @@ class Renderer:
         rect.midtop = x, y
         dest.blit(image, rect)
 
+    def draw_batch(self, dest: pygame.Surface, items: Iterable[Tuple[str, str, int, int]]):
+        """ Renders many stored images at once. Each item is (key, anchor, x, y), where anchor is a Rect
+            position attribute ("center", "topleft", "midbottom", ...) that is set to (x,y).
+            Rects are resolved in one pass and the whole batch is submitted with a single `blits` call.
+        """
+        images: Dict[str, pygame.Surface] = self._images
+        rects: Dict[str, pygame.Rect] = self._rects
+        l_blits: List[Tuple[pygame.Surface, pygame.Rect]] = []
+        for key, anchor, x, y in items:
+            rect: pygame.Rect = rects[key].copy()
+            setattr(rect, anchor, (x, y))
+            l_blits.append((images[key], rect))
+        dest.blits(l_blits, doreturn=False)
+
+    @staticmethod
+    def blit_batch(dest: pygame.Surface, blits: List[Tuple[pygame.Surface, pygame.Rect]]):
+        """ Renders a list of (image, rect) pairs that are already resolved, with a single `blits` call.
+        """
+        dest.blits(blits, doreturn=False)
+
     def store(self, key: str, image: pygame.Surface):
         """ Stores an image.
         """
@@ -179,24 +237,103 @@ class Renderer:
         """
         return self._rects.get(key)
 
+    def scaled(self, surface: pygame.Surface) -> pygame.Surface:
+        """ Returns a surface pre-scaled by `zoom` (nearest neighbour), scaling each surface once per zoom.
+            Reopening the display drops every scaled copy and reconverts the cursor.
+        """
+        if self._generation != ImageUtil.DISPLAY_GENERATION:
+            self._generation = ImageUtil.DISPLAY_GENERATION
+            self._scaled.clear()
+            self.cursor = ImageUtil.display_format(self.cursor_image())
+        i_zoom: int = self.zoom
+        if i_zoom == 1:
+            return surface
+        try:
+            source, output = self._scaled[id(surface), i_zoom]
+            if source is surface:
+                return output
+        except KeyError:
+            pass
+        w, h = surface.get_size()
+        output = ImageUtil.display_format(pygame.transform.scale(surface, (w * i_zoom, h * i_zoom)))
+        self._scaled[id(surface), i_zoom] = surface, output
+        return output
+
     def normalize(self, x: int, y: int) -> Tuple[int, int]:
         """ Normalizes (x,y) coordinates to scale.
         """
         return int(round(x * self.context.inv_scale_x)), int(round(y * self.context.inv_scale_y))
 
-    def flip(self):
+    def flip(self, rects: List[pygame.Rect] = None):
         """ Refresh screen contents.
+            With `rects` (in the target's coordinates), only those regions are upscaled and pushed to the display.
+            Upscaling follows `mode`: "nearest" at whole-number scales, "scale2x" at exactly 2x (nearest
+            otherwise), while "prescaled" frames are already at window resolution and are only presented.
+            Fractional scales always resample the whole frame.
         """
-        if self.scale_x != 1 or self.scale_y != 1:
+        if self.direct:
+            self.context.present(rects)
+            self.profiler.mark("flip")
+            return
+        i_scale: int = self.integer_scale
+        b_scale2x: bool = self.mode == "scale2x" and i_scale == 2
+        if rects is not None and i_scale:
+            rect_screen: pygame.Rect = self.internal.get_rect()
+            l_window: List[pygame.Rect] = []
+            for rect in rects:
+                if b_scale2x:
+                    # A changed pixel also changes its neighbours' scale2x output
+                    rect = rect.inflate(2, 2)
+                rect = rect.clip(rect_screen)
+                if rect.w and rect.h:
+                    rect_window: pygame.Rect = pygame.Rect(rect.x * i_scale, rect.y * i_scale, rect.w * i_scale, rect.h * i_scale)
+                    if b_scale2x:
+                        self.scale2x_rect(rect, rect_window)
+                    else:
+                        pygame.transform.scale(self.internal.subsurface(rect), rect_window.size, self.external.subsurface(rect_window))
+                    l_window.append(rect_window)
+            self.context.present(l_window)
+            self.profiler.mark("flip")
+            return
+        if b_scale2x:
+            pygame.transform.scale2x(self.internal, self.external)
+        elif self.scale_x != 1 or self.scale_y != 1:
             pygame.transform.scale(self.internal, self.window_size, self.external)
         else:
             self.external.blit(self.internal, (0, 0))
-        pygame.display.flip()
+        self.context.present()
+        self.profiler.mark("flip")
 
-    def render_cursor(self, dest: pygame.Surface):
-        x, y = pygame.mouse.get_pos()
-        x, y = self.normalize(x, y)
-        dest.blit(self.cursor, self.cursor.get_rect(topleft=(x, y)))
+    def scale2x_rect(self, rect: pygame.Rect, rect_window: pygame.Rect):
+        """ Applies scale2x to one region of the internal display, matching a whole-frame scale2x exactly.
+            The source is grown by a pixel, since each output pixel depends on its source pixel's neighbours.
+        """
+        rect_source: pygame.Rect = rect.inflate(2, 2).clip(self.internal.get_rect())
+        image: pygame.Surface = pygame.transform.scale2x(self.internal.subsurface(rect_source))
+        area: pygame.Rect = pygame.Rect((rect.x - rect_source.x) * 2, (rect.y - rect_source.y) * 2, rect_window.w, rect_window.h)
+        self.external.blit(image, rect_window, area)
+
+    def cursor_image(self) -> pygame.Surface:
+        """ Returns a new palettized, colorkeyed copy of the cursor.
+        """
+        i_image = ImageCache.SHARED.get(Renderer.CURSOR, self.palette, 16, 16).copy()
+        i_image.set_colorkey(ImageUtil.DEFAULT_PALETTE_3)
+        return i_image
+
+    def cursor_target(self) -> pygame.Rect:
+        """ Returns where the cursor would be drawn this frame.
+        """
+        x, y = self.normalize(*self.context.mouse_pos())
+        i_zoom: int = self.zoom
+        return self.scaled(self.cursor).get_rect(topleft=(x * i_zoom, y * i_zoom))
+
+    def render_cursor(self, dest: pygame.Surface) -> pygame.Rect:
+        """ Draws the cursor and returns the rect it was drawn to.
+        """
+        self.cursor_rect = self.cursor_target()
+        dest.blit(self.scaled(self.cursor), self.cursor_rect)
+        self.profiler.mark("cursor")
+        return self.cursor_rect
 
     def update(self, events: list):
         """ Updates local events.
@@ -212,3 +349,6 @@ class Renderer:
 
     def tick(self) -> float:
         return self.context.tick()
+
+    def wait(self, timeout: int) -> list:
+        return self.context.wait(timeout)
@@ -0,0 +1,105 @@
+#! usr/bin/env python3
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Tuple
+from src.utility import ScriptParser
+
+
+class ScriptCache:
+    """ On-disk cache of tokenized level scripts, keyed by file content hash and parser version.
+        Editing a script changes its hash, so stale entries are simply never looked up again.
+        Safe to share with a LevelLoader's worker thread.
+    """
+
+    DEFAULT_DIRECTORY: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".ccp_cache")
+    EXTENSION: str = ".json"
+
+    __slots__ = [
+        "directory",
+        "hits",
+        "misses",
+        "writes",
+        "lock"
+    ]
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY):
+        self.directory: str = directory
+        self.hits: int = 0
+        self.misses: int = 0
+        self.writes: int = 0
+        self.lock: threading.Lock = threading.Lock()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """ Hit, miss and write counters since creation (or the last `reset_stats`).
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "writes": self.writes}
+
+    @staticmethod
+    def key(b_contents: bytes) -> str:
+        """ Returns the cache key for a script's raw contents.
+        """
+        h = hashlib.sha1(b_contents)
+        h.update("v{}".format(ScriptParser.VERSION).encode())
+        return h.hexdigest()
+
+    def path(self, s_key: str) -> str:
+        """ Returns the cache file path for a given key.
+        """
+        return os.path.join(self.directory, s_key + ScriptCache.EXTENSION)
+
+    def clear(self):
+        """ Deletes every cached entry.
+        """
+        if os.path.isdir(self.directory):
+            for s_name in os.listdir(self.directory):
+                if s_name.endswith(ScriptCache.EXTENSION):
+                    os.remove(os.path.join(self.directory, s_name))
+
+    def reset_stats(self):
+        """ Zeroes all counters.
+        """
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+            self.writes = 0
+
+    def statements(self, filename: str) -> List[Tuple[Tuple[str], Tuple[str], int]]:
+        """ Returns the (header, params, line number) statements of a script,
+            tokenizing it only if no cached parse exists for its current contents.
+        """
+        with open(filename, "rb") as f:
+            b_contents: bytes = f.read()
+        s_path: str = self.path(ScriptCache.key(b_contents))
+        try:
+            with open(s_path, "r") as f:
+                l_cached: list = json.load(f)
+            if not isinstance(l_cached, list):
+                raise ValueError("Cached parse isn't a list")
+            l_output: List[Tuple[Tuple[str], Tuple[str], int]] = []
+            for h, p, n in l_cached:
+                if not (isinstance(h, list) and isinstance(p, list) and isinstance(n, int)):
+                    raise ValueError("Malformed cached statement")
+                l_output.append((tuple(h), tuple(p), n))
+            with self.lock:
+                self.hits += 1
+            return l_output
+        except (OSError, ValueError, TypeError):
+            with self.lock:
+                self.misses += 1
+
+        l_statements = list(ScriptParser.stream_chunks([b_contents.decode()]))
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            s_temp: str = "{}.{}.{}.tmp".format(s_path, os.getpid(), threading.get_ident())
+            with open(s_temp, "w") as f:
+                json.dump(l_statements, f, separators=(",", ":"))
+            os.replace(s_temp, s_path)
+            with self.lock:
+                self.writes += 1
+        except OSError:
+            pass
+        return l_statements
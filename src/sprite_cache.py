@@ -0,0 +1,136 @@
+#! usr/bin/env python3
+import hashlib
+import os
+import threading
+import numpy as np
+from typing import Dict
+from src.utility_image import ImageUtil
+
+
+class SpriteCache:
+    """ On-disk cache of decoded sprites: one .npy file of palette indices per image string and size.
+        Files are named `<key>.<pixel hash>.npy`. The directory is listed once, each hit is a single
+        memory-mapped np.load, and the pixels are checked against their hash before they're used.
+    """
+
+    DEFAULT_DIRECTORY: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".ccp_cache", "sprites")
+    EXTENSION: str = ".npy"
+    VERSION: int = 1
+
+    __slots__ = [
+        "directory",
+        "index",
+        "hits",
+        "misses",
+        "writes",
+        "rejects",
+        "lock"
+    ]
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY):
+        self.directory: str = directory
+        self.index: Dict[str, str] = {}
+        self.hits: int = 0
+        self.misses: int = 0
+        self.writes: int = 0
+        self.rejects: int = 0
+        self.lock: threading.Lock = threading.Lock()
+        self.scan()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """ Hit, miss, write and reject (failed integrity check) counters.
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "writes": self.writes, "rejects": self.rejects}
+
+    @staticmethod
+    def key(s_value: str, w: int, h: int) -> str:
+        """ Returns the cache key of an image string decoded at a given size.
+        """
+        return hashlib.sha1("v{}:{}:{}:{}".format(SpriteCache.VERSION, s_value, w, h).encode()).hexdigest()
+
+    @staticmethod
+    def digest(image: np.ndarray) -> str:
+        """ Returns the integrity hash of a decoded sprite's pixels.
+        """
+        return hashlib.sha1(np.ascontiguousarray(image).tobytes()).hexdigest()
+
+    def path(self, s_key: str, s_digest: str) -> str:
+        """ Returns the cache file path for a key and pixel hash.
+        """
+        return os.path.join(self.directory, "{}.{}{}".format(s_key, s_digest, SpriteCache.EXTENSION))
+
+    def scan(self):
+        """ Rebuilds the key -> pixel hash index from the directory listing.
+        """
+        self.index.clear()
+        if os.path.isdir(self.directory):
+            for s_name in os.listdir(self.directory):
+                l_parts = s_name.split(".")
+                if len(l_parts) == 3 and "." + l_parts[2] == SpriteCache.EXTENSION:
+                    self.index[l_parts[0]] = l_parts[1]
+
+    def clear(self):
+        """ Deletes every cached sprite.
+        """
+        for s_key, s_digest in list(self.index.items()):
+            try:
+                os.remove(self.path(s_key, s_digest))
+            except OSError:
+                pass
+        self.index.clear()
+
+    def load(self, s_key: str) -> np.ndarray:
+        """ Returns a cached sprite (memory-mapped, read-only), or None if it's missing or fails its hash check.
+        """
+        s_digest: str = self.index.get(s_key)
+        if s_digest is None:
+            return None
+        s_path: str = self.path(s_key, s_digest)
+        try:
+            image: np.ndarray = np.load(s_path, mmap_mode="r")
+            if SpriteCache.digest(image) == s_digest:
+                return image
+        except (OSError, ValueError):
+            pass
+        with self.lock:
+            self.rejects += 1
+        self.index.pop(s_key, None)
+        try:
+            os.remove(s_path)
+        except OSError:
+            pass
+        return None
+
+    def store(self, s_key: str, image: np.ndarray):
+        """ Writes a decoded sprite to the cache.
+        """
+        s_digest: str = SpriteCache.digest(image)
+        s_path: str = self.path(s_key, s_digest)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            s_temp: str = "{}.{}.{}.tmp".format(s_path, os.getpid(), threading.get_ident())
+            with open(s_temp, "wb") as f:
+                np.save(f, image)
+            os.replace(s_temp, s_path)
+            self.index[s_key] = s_digest
+            with self.lock:
+                self.writes += 1
+        except OSError:
+            pass
+
+    def decode(self, s_value: str, w: int, h: int) -> np.ndarray:
+        """ Returns the palette indices of an image string, decoding (and caching) them only on a miss.
+        """
+        s_key: str = SpriteCache.key(s_value, w, h)
+        image: np.ndarray = self.load(s_key)
+        if image is not None:
+            with self.lock:
+                self.hits += 1
+            return image
+        with self.lock:
+            self.misses += 1
+        image = ImageUtil.deserialize(s_value, w, h).astype(np.uint8)
+        self.store(s_key, image)
+        return image
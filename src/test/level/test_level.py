@@ -1,12 +1,28 @@
 #! usr/bin/env python3
+import json
+import os
+import tempfile
+import pygame
 from src.level import Level
 from src.block_system import BlockSystem
+from src.frame_profiler import FrameProfiler
 from src.level_interface import LevelInterface
+from src.level_loader import LevelLoader
 from src.level_image import LevelImage
-from src.utility import Utility
+from src.level_pack import LevelPack
+from src.level_script import LevelScript
+from src.level_watch import LevelWatcher
+from src.render_context import HeadlessRenderContext, RenderContext
+from src.script_cache import ScriptCache
+from src.texture_atlas import TextureAtlas
+from src.utility import ScriptError, ScriptParser, Utility
+from src.utility_image import ImageUtil
 from src.test.test_base import TestBase
 
 
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+
 class TestLevel(TestBase):
     """ Test suite for level creation.
     """
@@ -33,6 +49,371 @@ class TestLevel(TestBase):
         print(s.best_length())
         # cls.test_ascertain(s.best_length() == 9)
 
+    @classmethod
+    def test_opcode_dispatch(cls):
+        s: BlockSystem = BlockSystem()
+        i: LevelInterface = LevelInterface()
+        im: LevelImage = LevelImage()
+        statements = [
+            (("SYSTEM", "CYCLE", "ADD"), ("MAIN", "1", "2", "3"), 1),
+            (("SYSTEM", "NODE", "CREATE"), ("A",), 2),
+            (("system", "node", "setcycle"), ("A", "MAIN"), 3),
+            (("SYSTEM", "NODE", "SETVALUE"), ("A", "2"), 4),
+            (("SYSTEM", "NODE", "SETSTATIC"), ("A", "true"), 5),
+            (("IMAGE", "ADDIMAGE"), ("IMAGE1",), 6),
+            (("UNKNOWN", "OPCODE"), ("A",), 7),
+        ]
+        LevelScript.interpret(s, i, im, statements, headless=True)
+        cls.test_ascertain(s.cycle_get("MAIN") == ("1", "2", "3"))
+        cls.test_ascertain(s.node_get_index(s.node_get("A")) == 1)
+        cls.test_ascertain(s.node_get_static("A"))
+        cls.test_ascertain(not im.image_entity)
+
+    @classmethod
+    def test_level_pack(cls):
+        l_files = [Utility.abspath(__file__, x) for x in ("DUMMY_1.CCP", "DUMMY_2.CCP", "PUZZLE_16.CCP")]
+        with tempfile.TemporaryDirectory() as s_dir:
+            s_pack: str = os.path.join(s_dir, "levels.ccpk")
+            LevelPack.build_from_files(s_pack, l_files)
+            with LevelPack(s_pack) as pack:
+                cls.test_ascertain(pack.names == ["DUMMY_1", "DUMMY_2", "PUZZLE_16"])
+                cls.test_ascertain(all(pack.verify(x) for x in pack.names))
+                cls.test_ascertain(list(pack.stream("DUMMY_2", 64)) == list(ScriptParser.stream(l_files[1])))
+            LevelPack.build(s_pack, {"TRUNCATED": "[SYSTEM NODE CREATE] <\u00e9>!".encode()[:-3]})
+            with LevelPack(s_pack) as pack:
+                try:
+                    list(pack.stream("TRUNCATED", 4))
+                    cls.test_ascertain(False)
+                except UnicodeDecodeError:
+                    cls.test_ascertain(True)
+
+    @classmethod
+    def test_compile_images(cls):
+        with open(Utility.abspath(__file__, "DUMMY_1.CCP"), "rb") as f:
+            b_level: bytes = f.read()
+        for b_source in (b_level, b_level.replace(b"[IMAGE SETVALUE]", b"[image setvalue]")):
+            b_compiled: bytes = LevelPack.compile_images(b_source)
+            l_old = [p for h, p, _ in ScriptParser.stream_chunks([b_source.decode()]) if LevelScript.normalize(h) == ("IMAGE", "SETVALUE")]
+            l_new = [p for h, p, _ in ScriptParser.stream_chunks([b_compiled.decode()]) if LevelScript.normalize(h) == ("IMAGE", "SETVALUE")]
+            cls.test_ascertain(len(l_old) == len(l_new) == 4)
+            for t_old, t_new in zip(l_old, l_new):
+                i_w, i_h = int(t_old[2]), int(t_old[3])
+                cls.test_ascertain(ImageUtil.is_binary(t_new[1]) and t_new[2:] == t_old[2:])
+                cls.test_ascertain((ImageUtil.deserialize(t_new[1], i_w, i_h) == ImageUtil.deserialize(t_old[1], i_w, i_h)).all())
+
+    @classmethod
+    def test_image_import(cls):
+        s: BlockSystem = BlockSystem()
+        i: LevelInterface = LevelInterface()
+        im1: LevelImage = LevelImage()
+        im2: LevelImage = LevelImage()
+        statements = [(("IMAGE", "IMPORT"), ("blocks_default",), 1)]
+        LevelScript.interpret(s, i, im1, statements)
+        LevelScript.interpret(s, i, im2, statements)
+        cls.test_ascertain(im1.image_get_label(im1.image_get_key("BLOCK_IMAGES"), 3) == "IMAGE4")
+        cls.test_ascertain(im1.image_get("BLOCK_IMAGES", 0) is im2.image_get("BLOCK_IMAGES", 0))
+        palette = ImageUtil.new_palette(ImageUtil.PALETTE_B_0, ImageUtil.PALETTE_B_1, ImageUtil.PALETTE_B_2, ImageUtil.PALETTE_B_3)
+        im1.image_set_palette(palette)
+        cls.test_ascertain(im1.image_get("BLOCK_IMAGES", 0) is not im2.image_get("BLOCK_IMAGES", 0))
+        cls.test_ascertain(im1.image_get("BLOCK_IMAGES", 0).get_palette_at(1)[:3] == tuple(ImageUtil.PALETTE_B_1))
+        cls.test_ascertain(im2.image_get("BLOCK_IMAGES", 0).get_palette_at(1)[:3] == tuple(ImageUtil.PALETTE_A_1))
+        library: LevelImage = LevelScript.library("blocks_default")
+        try:
+            LevelScript.interpret(s, i, LevelImage(), [(("IMAGE", "IMPORT"), ("no_such_library",), 7)])
+            cls.test_ascertain(False)
+        except ScriptError as e:
+            cls.test_ascertain(e.line == 7)
+        cls.test_ascertain(LevelScript.library("blocks_default") is library)
+
+    @classmethod
+    def test_texture_atlas(cls):
+        im: LevelImage = LevelImage()
+        Level.from_script(BlockSystem(), LevelInterface(), im, Utility.abspath(__file__, "DUMMY_1.CCP"))
+        d_surfaces = {k: im.image_decode(k) for k in im.image_entity}
+        atlas: TextureAtlas = im.image_pack()
+        cls.test_ascertain(len(atlas) == len(d_surfaces))
+        l_rects = list(atlas.rects.values())
+        cls.test_ascertain(not any(a.colliderect(b) for n, a in enumerate(l_rects) for b in l_rects[n + 1:]))
+        for s_label, surface in d_surfaces.items():
+            packed = im.image_decode(s_label)
+            cls.test_ascertain(packed.get_parent() is atlas.surface)
+            cls.test_ascertain((pygame.surfarray.array3d(packed) == pygame.surfarray.array3d(surface)).all())
+        with tempfile.TemporaryDirectory() as s_dir:
+            s_atlas: str = os.path.join(s_dir, "atlas" + TextureAtlas.EXTENSION)
+            atlas.save(s_atlas)
+            im2: LevelImage = LevelImage()
+            Level.from_script(BlockSystem(), LevelInterface(), im2, Utility.abspath(__file__, "DUMMY_1.CCP"))
+            loaded: TextureAtlas = TextureAtlas.load(s_atlas, im2.palette)
+            cls.test_ascertain(im2.image_pack(loaded) is loaded and loaded.rects == atlas.rects)
+
+    @classmethod
+    def test_flip_frames(cls):
+        im: LevelImage = LevelImage()
+        Level.from_script(BlockSystem(), LevelInterface(), im, Utility.abspath(__file__, "DUMMY_1.CCP"))
+        surface = im.image_get("BLOCK_IMAGES", 0)
+        cls.test_ascertain(im.image_get_scaled("BLOCK_IMAGES", 0, 1.0) is surface)
+        frame = im.image_get_scaled("BLOCK_IMAGES", 0, 0.5)
+        cls.test_ascertain(frame.get_size() == (surface.get_width(), surface.get_height() // 2))
+        cls.test_ascertain(im.image_get_scaled("BLOCK_IMAGES", 0, 0.49) is frame)
+        cls.test_ascertain(im.image_get_scaled("BLOCK_IMAGES", 0, 0.02).get_height() == 1)
+        display = im.image_get_display("BLOCK_IMAGES", 0, 0.5)
+        cls.test_ascertain(im.image_get_display("BLOCK_IMAGES", 0, 0.49) is display)
+        cls.test_ascertain((pygame.surfarray.array3d(display) == pygame.surfarray.array3d(frame)).all())
+        im.image_set_palette(ImageUtil.new_palette(
+              ImageUtil.PALETTE_B_0, ImageUtil.PALETTE_B_1, ImageUtil.PALETTE_B_2, ImageUtil.PALETTE_B_3
+        ))
+        recolored = im.image_get_display("BLOCK_IMAGES", 0, 0.5)
+        cls.test_ascertain(recolored is not display)
+        cls.test_ascertain((pygame.surfarray.array3d(recolored) == pygame.surfarray.array3d(im.image_get_scaled("BLOCK_IMAGES", 0, 0.5))).all())
+
+    @classmethod
+    def test_script_cache(cls):
+        s: BlockSystem = BlockSystem()
+        i: LevelInterface = LevelInterface()
+        im: LevelImage = LevelImage()
+        filename: str = Utility.abspath(__file__, "DUMMY_1.CCP")
+        with tempfile.TemporaryDirectory() as s_dir:
+            cache: ScriptCache = ScriptCache(s_dir)
+            Level.from_script(s, i, im, filename, headless=True, cache=cache)
+            Level.from_script(s, i, im, filename, headless=True, cache=cache)
+            cls.test_ascertain(cache.stats == {"hits": 1, "misses": 1, "writes": 1})
+            cls.test_ascertain(cache.statements(filename) == list(ScriptParser.stream(filename)))
+            cls.test_ascertain(len(s.node_entity) == 16)
+            with open(filename, "rb") as f:
+                s_path: str = cache.path(ScriptCache.key(f.read()))
+            for s_bad in ('{"a": 1}', '[["SYSTEM"], ["x"]]', '[1, 2]', '["abc"]', '[[["A"], ["B"], "1"]]'):
+                with open(s_path, "w") as f:
+                    f.write(s_bad)
+                cache.reset_stats()
+                cls.test_ascertain(cache.statements(filename) == list(ScriptParser.stream(filename)))
+                cls.test_ascertain(cache.stats == {"hits": 0, "misses": 1, "writes": 1})
+
+    @classmethod
+    def test_script_diff(cls):
+        l_old = [
+            (("SYSTEM", "NODE", "CREATE"), ("A",), 1),
+            (("SYSTEM", "NODE", "SETVALUE"), ("A", "1"), 2),
+            (("SYSTEM", "NODE", "LINKDOUBLE"), ("A", "B"), 3),
+        ]
+        l_setter = [l_old[0], (("SYSTEM", "NODE", "SETVALUE"), ("A", "2"), 2), l_old[2]]
+        l_unlinked = l_old[:2]
+        cls.test_ascertain(LevelScript.diff(l_old, l_old) == [])
+        cls.test_ascertain(LevelScript.diff(l_old, l_setter) == [l_setter[1]])
+        cls.test_ascertain(LevelScript.diff(l_old, l_unlinked) is None)
+
+    @classmethod
+    def test_level_loader(cls):
+        level: Level = Level(RenderContext())
+        loader: LevelLoader = LevelLoader([Utility.abspath(__file__, x) for x in ("DUMMY_1.CCP", "DUMMY_2.CCP")])
+        try:
+            for s_name in ("DUMMY_1.CCP", "DUMMY_2.CCP"):
+                cls.test_ascertain(loader.next(level).endswith(s_name))
+                cls.test_ascertain(set(level.images.image_cache) == set(level.images.image_entity))
+                for s_block in level.interface.blocks:
+                    s_node: str = level.system.node_get(level.interface.block_get_node(s_block))
+                    cls.test_ascertain(level.interface.block_get_image(s_block)[1] == level.system.node_get_index(s_node))
+            cls.test_ascertain(not loader)
+        finally:
+            loader.shutdown()
+
+    @classmethod
+    def test_dirty_render(cls):
+        level: Level = Level(RenderContext())
+        level.load_from_script(Utility.abspath(__file__, "DUMMY_1.CCP"))
+
+        def repaint() -> pygame.Surface:
+            surface: pygame.Surface = pygame.Surface(level.renderer.screen_size)
+            level.draw_background(surface)
+            level.draw_blocks(surface)
+            surface.blit(level.renderer.cursor, level.renderer.cursor_rect)
+            return surface
+
+        level.render(0.016)
+        cls.test_ascertain(level.dirty_rects(level.block_frames()) == [])
+        x, y = level.interface.block_get_position("5")
+        level.press_block(x, y)
+        for _ in range(30):
+            level.render(0.016)
+            cls.test_ascertain((pygame.surfarray.array3d(level.renderer.internal) == pygame.surfarray.array3d(repaint())).all())
+
+    @classmethod
+    def test_scene_layers(cls):
+        c: HeadlessRenderContext = HeadlessRenderContext()
+        level: Level = Level(c)
+        level.load_from_script(Utility.abspath(__file__, "DUMMY_1.CCP"))
+        level.press_block(*level.interface.block_get_position("5"))
+        while level.scale_changing:
+            level.render(0.016)
+        cls.test_ascertain(level.scene_layer is None and level.scene_layers(level.block_frames())[0] is None)
+        # Opt-in: resting blocks are composited into a layer that's rebuilt only when one of them changes
+        Level.STATIC_LAYER = True
+        try:
+            level.frame_state = ()
+            level.render(0.016)
+            level.render(0.016)
+            cls.test_ascertain(level.scene_layer is None)
+            level.press_block(*level.interface.block_get_position("5"))
+            l_builds = []
+            while level.scale_changing or not l_builds:
+                level.render(0.016)
+                if not l_builds or level.scene_static is not l_builds[-1]:
+                    l_builds.append(level.scene_static)
+            c.mouse = (200, 150)
+            level.render(0.016)
+        finally:
+            Level.STATIC_LAYER = False
+        cls.test_ascertain(len(l_builds) <= 3 and 0 < len(l_builds[0]) < len(level.interface.blocks))
+        cls.test_ascertain(len(level.scene_static) == len(level.interface.blocks))
+        surface: pygame.Surface = pygame.Surface(level.renderer.screen_size)
+        level.draw_background(surface)
+        level.draw_blocks(surface)
+        cls.test_ascertain((pygame.surfarray.array3d(level.scene_layer) == pygame.surfarray.array3d(surface)).all())
+
+    @classmethod
+    def test_idle_update(cls):
+        level: Level = Level(RenderContext())
+        level.load_from_script(Utility.abspath(__file__, "DUMMY_1.CCP"))
+        cls.test_ascertain(level.is_idle() and level.update() == 0.0)
+        x, y = level.interface.block_get_position("5")
+        level.press_block(x, y)
+        cls.test_ascertain(not level.is_idle() and level.update() > 0.0)
+
+    @classmethod
+    def test_headless_capture(cls):
+        with tempfile.TemporaryDirectory() as s_dir:
+            c: HeadlessRenderContext = HeadlessRenderContext(capture_dir=s_dir, keep_frames=True)
+            level: Level = Level(c)
+            level.load_from_script(Utility.abspath(__file__, "DUMMY_1.CCP"))
+            c.mouse = (100, 100)
+            level.render(level.update())
+            x, y = level.interface.block_get_position("5")
+            level.press_block(x, y)
+            for _ in range(3):
+                level.render(level.update())
+            cls.test_ascertain(c.frame_count == 4 and len(c.frames) == 4)
+            cls.test_ascertain(c.frames[0].shape == (*c.window_size, 3) and (c.frames[-1] == c.capture()).all())
+            cls.test_ascertain(not (c.frames[0] == c.frames[-1]).all())
+            l_files = sorted(os.listdir(s_dir))
+            cls.test_ascertain(l_files == [HeadlessRenderContext.FRAME_NAME.format(i) for i in range(4)])
+            image: pygame.Surface = pygame.image.load(os.path.join(s_dir, l_files[-1]))
+            cls.test_ascertain((pygame.surfarray.array3d(image) == c.frames[-1]).all())
+
+    @classmethod
+    def test_frame_profiler(cls):
+        level: Level = Level(HeadlessRenderContext())
+        level.load_from_script(Utility.abspath(__file__, "DUMMY_1.CCP"))
+        profiler: FrameProfiler = level.renderer.profiler
+        level.render(level.update())
+        cls.test_ascertain(len(profiler) == 0 and profiler.summary() == {})
+        profiler.toggle_overlay()
+        x, y = level.interface.block_get_position("5")
+        level.press_block(x, y)
+        for _ in range(FrameProfiler.CAPACITY + 5):
+            level.render(level.update())
+        cls.test_ascertain(profiler.enabled and len(profiler) == FrameProfiler.CAPACITY)
+        frames = profiler.frames()
+        cls.test_ascertain((frames[:, :len(FrameProfiler.PHASES)].sum(axis=1) <= frames[:, -2]).all())
+        d_summary = profiler.summary()
+        cls.test_ascertain(set(FrameProfiler.PHASES) < d_summary.keys() and d_summary["p50"] <= d_summary["p99"])
+        cls.test_ascertain(profiler.overlay_rect.w > 0 and level.renderer.internal.get_at(profiler.overlay_rect.center) != level.background.get_at(profiler.overlay_rect.center))
+        with tempfile.TemporaryDirectory() as s_dir:
+            profiler.dump(os.path.join(s_dir, "trace.csv"))
+            profiler.dump(os.path.join(s_dir, "trace.json"))
+            with open(os.path.join(s_dir, "trace.csv"), "r") as f:
+                l_lines = f.read().splitlines()
+            cls.test_ascertain(l_lines[0] == ",".join(FrameProfiler.COLUMNS) and len(l_lines) == FrameProfiler.CAPACITY + 1)
+            with open(os.path.join(s_dir, "trace.json"), "r") as f:
+                d_trace = json.load(f)
+            cls.test_ascertain(len(d_trace["frames"]) == FrameProfiler.CAPACITY and d_trace["summary"]["fps"] > 0)
+
+    @classmethod
+    def test_upscale_modes(cls):
+        def frames(s_mode: str, b_full: bool = False):
+            c: HeadlessRenderContext = HeadlessRenderContext()
+            level: Level = Level(c)
+            level.renderer.mode = s_mode
+            level.load_from_script(Utility.abspath(__file__, "DUMMY_1.CCP"))
+            c.mouse = (101, 77)
+            for i in range(40):
+                if i == 2:
+                    level.press_block(*level.interface.block_get_position("5"))
+                elif i == 20:
+                    c.mouse = (300, 200)
+                if b_full:
+                    level.frame_state = ()
+                level.render(level.update())
+                yield pygame.surfarray.array3d(c.external), level.renderer.internal
+
+        for a, internal in frames("scale2x"):
+            cls.test_ascertain((a == pygame.surfarray.array3d(pygame.transform.scale2x(internal))).all())
+        l_prescaled = [a for a, _ in frames("prescaled")]
+        cls.test_ascertain(all((a == b).all() for a, (b, _) in zip(l_prescaled, frames("prescaled", True))))
+        l_nearest = [a for a, _ in frames("nearest")]
+        cls.test_ascertain((l_prescaled[0] == l_nearest[0]).all() and (l_prescaled[-1] == l_nearest[-1]).all())
+
+    @classmethod
+    def test_display_format(cls):
+        c: RenderContext = RenderContext()
+        level: Level = Level(c)
+        level.load_from_script(Utility.abspath(__file__, "DUMMY_1.CCP"))
+        level.render(0.0)
+        i_format = c.external.get_bitsize(), c.external.get_masks()
+        l_surfaces = [level.background, level.renderer.cursor] + [x for x, _ in level.frame_blocks.values()]
+        cls.test_ascertain(all((x.get_bitsize(), x.get_masks()) == i_format for x in l_surfaces))
+        cls.test_ascertain(level.renderer.cursor.get_flags() & pygame.RLEACCELOK)
+        cls.test_ascertain(Level(c).background is level.background)
+        # Reopening the display drops every converted copy; headless images aren't cached at all
+        background, cursor = level.background, level.renderer.cursor
+        c.window_w = c.window_w
+        d_display = dict(level.images.image_display)
+        level.render(0.0)
+        cls.test_ascertain(level.background is not background and level.renderer.cursor is not cursor)
+        cls.test_ascertain(d_display and all(level.images.image_display.get(k) is not x for k, x in d_display.items()))
+
+    @classmethod
+    def test_draw_batch(cls):
+        level: Level = Level(HeadlessRenderContext())
+        level.load_from_script(Utility.abspath(__file__, "DUMMY_1.CCP"))
+        renderer = level.renderer
+        for i in range(4):
+            renderer.store(str(i), level.images.image_get("BLOCK_IMAGES", i))
+        l_items = [(str(i % 4), x, 16 * i, 8 * i + 3) for i, x in enumerate(("center", "topleft", "midbottom", "bottomright") * 3)]
+        expected = pygame.Surface(renderer.screen_size)
+        for key, anchor, x, y in l_items:
+            getattr(renderer, "draw_" + anchor)(expected, key, x, y)
+        actual = pygame.Surface(renderer.screen_size)
+        renderer.draw_batch(actual, l_items)
+        cls.test_ascertain((pygame.surfarray.array3d(actual) == pygame.surfarray.array3d(expected)).all())
+
+    @classmethod
+    def test_watch_reload(cls):
+        level: Level = Level(RenderContext())
+        watcher: LevelWatcher = LevelWatcher(level, Utility.abspath(__file__, "DUMMY_1.CCP"))
+        watcher.load()
+        level.images.image_preload()
+        level.system.answers[1] = ["A"]
+        d_surfaces = dict(level.images.image_cache)
+        l_base = watcher.statements
+
+        def edit(t_old: tuple, t_new: tuple) -> list:
+            return [(h, t_new if p == t_old else p, n) for h, p, n in l_base]
+
+        # In place: surfaces and answers survive
+        watcher.reload(edit(("0", "16", "32"), ("0", "20", "32")))
+        cls.test_ascertain(watcher.reloads == 1 and watcher.full_reloads == 0)
+        cls.test_ascertain(level.interface.block_get_position("0") == [20, 32])
+        cls.test_ascertain(level.system.answers == {1: ["A"]} and level.images.image_cache == d_surfaces)
+
+        # Full reload (a setter's only statement removed): unchanged surfaces and answers are carried over
+        watcher.reload([x for x in l_base if x[1] != ("F", "BLOCK_IMAGES")])
+        cls.test_ascertain(watcher.full_reloads == 1)
+        cls.test_ascertain(level.system.answers == {1: ["A"]})
+        cls.test_ascertain(all(level.images.image_cache[k] is v for k, v in d_surfaces.items()))
+
+        # Any system edit invalidates the solver's answers
+        watcher.reload(edit(("C", "4"), ("C", "3")))
+        cls.test_ascertain(watcher.full_reloads == 1 and not level.system.answers)
+
 
 if __name__ == "__main__":
     TestLevel.test_read_from_script()
@@ -1,4 +1,11 @@
 #! usr/bin/env python3
+import tempfile
+import numpy as np
+import pygame
+from src.background import Background
+from src.utility import ScriptParser, Utility
+from src.image_cache import ImageCache
+from src.sprite_cache import SpriteCache
 from src.utility_image import ImageUtil
 from src.test.test_base import TestBase
 
@@ -18,6 +25,137 @@ class TestUtility(TestBase):
         z = ImageUtil.hydrate(y)
         cls.test_ascertain(x == z)
 
+    @classmethod
+    def test_stream_chunking(cls):
+        filename: str = Utility.abspath(__file__, "../level/DUMMY_2.CCP")
+        statements = list(ScriptParser.stream(filename))
+        cls.test_ascertain(all(list(ScriptParser.stream(filename, n)) == statements for n in (1, 5, 333)))
+        cls.test_ascertain(statements[0] == (("SYSTEM", "CYCLE", "ADD"), ("MAIN", "1", "2", "3", "4"), 1))
+        cls.test_ascertain(statements[1][2] == 2)
+
+    @classmethod
+    def test_deserialize_layout(cls):
+        # 0xe4 = 11 10 01 00 -> one 2x2 tile; 0x1b = 00 01 10 11 -> the tile to its right
+        image = ImageUtil.deserialize("e41b", 2, 4)
+        cls.test_ascertain(image.tolist() == [[3, 2, 0, 1], [1, 0, 2, 3]])
+
+    @classmethod
+    def test_codec_reference(cls):
+        filename: str = Utility.abspath(__file__, "../level/DUMMY_1.CCP")
+        l_images = [t[1][1] for t in ScriptParser.stream(filename) if t[0] == ("IMAGE", "SETVALUE")]
+        l_hex = [ImageUtil.hydrate(x) for x in l_images]
+        cls.test_ascertain(l_hex == [ImageUtil.hydrate_reference(x) for x in l_images])
+        cls.test_ascertain([ImageUtil.dessicate(x) for x in l_hex] == [ImageUtil.dessicate_reference(x) for x in l_hex])
+        cls.test_ascertain([ImageUtil.dessicate(x) for x in l_hex] == l_images)
+
+    @classmethod
+    def test_codec_long_counts(cls):
+        # A blank band: one run with a 4+ digit count, which the reference still collapses correctly
+        x = "f3cc" * 40 + "00" * 6000 + "3c"
+        y = ImageUtil.dessicate(x)
+        cls.test_ascertain(y == ImageUtil.dessicate_reference(x))
+        cls.test_ascertain(ImageUtil.hydrate(y) == x)
+        # A count whose digits repeat a later unit; the reference rewrites the count and can't hydrate it back
+        x = "00" * 4848 + "ab1212cd"
+        y = ImageUtil.dessicate(x)
+        cls.test_ascertain(y == "(GG,1212)ab(12,2)cd")
+        cls.test_ascertain(ImageUtil.hydrate(y) == x and ImageUtil.hydrate_reference(y) == x)
+        # Counts with leading zeros expand exactly as the reference does, without falling back to it
+        for y in ("(ab,05)(ab,5)", "(ab,5)(ab,05)", "(G3,00)(G3,0)c", "(abc,010)(ab,2)"):
+            cls.test_ascertain(ImageUtil.hydrate(y) == ImageUtil.hydrate_reference(y))
+        # Pairing is a single pass that matches the pairwise passes: "000000" -> "gg" + "g" -> "Gg"
+        cls.test_ascertain(ImageUtil.pair("0000001fff") == "Gg1xf" and ImageUtil.unpair("Gg1xf") == "0000001fff")
+
+    @classmethod
+    def test_encoder_roundtrip(cls):
+        image = np.random.randint(0, 4, (16, 32)).astype(np.int8)
+        s_image: str = ImageUtil.numpy_image_to_string(image)
+        cls.test_ascertain(s_image == ImageUtil.numpy_image_to_string_reference(image))
+        cls.test_ascertain((ImageUtil.deserialize(s_image, 16, 32) == image).all())
+
+    @classmethod
+    def test_binary_roundtrip(cls):
+        image = np.random.randint(0, 4, (16, 32)).astype(np.int8)
+        s_image: str = ImageUtil.numpy_image_to_string(image)
+        for b_compress in (True, False):
+            s_binary: str = ImageUtil.numpy_image_to_binary(image, b_compress)
+            cls.test_ascertain(ImageUtil.is_binary(s_binary) and not ImageUtil.is_binary(s_image))
+            cls.test_ascertain(ImageUtil.to_binary(s_image, b_compress) == s_binary)
+            cls.test_ascertain(ImageUtil.hydrate(s_binary) == ImageUtil.hydrate(s_image))
+            cls.test_ascertain((ImageUtil.deserialize(s_binary, 16, 32) == ImageUtil.deserialize(s_image, 16, 32)).all())
+
+    @classmethod
+    def test_indexed_surface(cls):
+        image = np.random.randint(0, 4, (16, 32)).astype(np.int8)
+        palette_a = ImageUtil.new_palette(ImageUtil.PALETTE_A_0, ImageUtil.PALETTE_A_1, ImageUtil.PALETTE_A_2, ImageUtil.PALETTE_A_3)
+        palette_b = ImageUtil.new_palette(ImageUtil.PALETTE_B_0, ImageUtil.PALETTE_B_1, ImageUtil.PALETTE_B_2, ImageUtil.PALETTE_B_3)
+        surface = ImageUtil.indexed_surface(image, palette_a)
+        cls.test_ascertain(surface.get_bitsize() == 8 and surface.get_size() == (16, 32))
+        cls.test_ascertain((pygame.surfarray.array2d(surface) == image).all())
+        surface.set_palette(ImageUtil.palette_colors(palette_b))
+        cls.test_ascertain((pygame.surfarray.array3d(surface) == np.array(ImageUtil.palette_colors(palette_b))[image]).all())
+
+    @classmethod
+    def test_background(cls):
+        surface = Background.gradient((320, 240))
+        cls.test_ascertain(Background.gradient((320, 240)) is surface and Background.gradient((320, 240), "vertical") is not surface)
+        cls.test_ascertain(Background.get((320, 240)) is Background.get((320, 240)))
+        for s_style in Background.STYLES:
+            image = pygame.surfarray.array3d(Background.gradient((64, 48), s_style))[:, :, 0].astype(int)
+            cls.test_ascertain(image.shape == (64, 48) and image[0, 0] == 0 and image[-1, -1] == 255)
+            cls.test_ascertain((np.diff(image, axis=0) >= 0).all() and (np.diff(image, axis=1) >= 0).all())
+
+    @classmethod
+    def test_display_format(cls):
+        image = np.random.randint(0, 4, (16, 32)).astype(np.int8)
+        palette = ImageUtil.new_palette(ImageUtil.PALETTE_A_0, ImageUtil.PALETTE_A_1, ImageUtil.PALETTE_A_2, ImageUtil.PALETTE_A_3)
+        surface = ImageUtil.indexed_surface(image, palette)
+        surface.set_colorkey(ImageUtil.PALETTE_A_3)
+        output = ImageUtil.display_format(surface)
+        if pygame.display.get_surface() is None:
+            cls.test_ascertain(output is surface)
+        else:
+            cls.test_ascertain(output.get_bitsize() == pygame.display.get_surface().get_bitsize())
+            cls.test_ascertain(output.get_flags() & pygame.RLEACCELOK and output.get_colorkey() == surface.get_colorkey())
+            cls.test_ascertain((pygame.surfarray.array3d(output) == pygame.surfarray.array3d(surface)).all())
+            surface.set_colorkey(None)
+            output = ImageUtil.display_format(surface)
+            cls.test_ascertain(output.get_colorkey() is None and output.get_bitsize() == pygame.display.get_surface().get_bitsize())
+            cls.test_ascertain((pygame.surfarray.array3d(output) == pygame.surfarray.array3d(surface)).all())
+
+    @classmethod
+    def test_image_cache(cls):
+        palette_a = ImageUtil.new_palette(ImageUtil.PALETTE_A_0, ImageUtil.PALETTE_A_1, ImageUtil.PALETTE_A_2, ImageUtil.PALETTE_A_3)
+        palette_b = ImageUtil.new_palette(ImageUtil.PALETTE_B_0, ImageUtil.PALETTE_B_1, ImageUtil.PALETTE_B_2, ImageUtil.PALETTE_B_3)
+        l_images = [ImageUtil.numpy_image_to_string(np.full((16, 16), n, dtype=np.int8)) for n in range(3)]
+        cache: ImageCache = ImageCache(budget=2 * 16 * 16)
+        surface = cache.get(l_images[0], palette_a, 16, 16)
+        cls.test_ascertain(cache.get(l_images[0], palette_a, 16, 16) is surface)
+        cls.test_ascertain(cache.get(l_images[0], palette_b, 16, 16) is not surface)
+        cache.get(l_images[1], palette_a, 16, 16)
+        cls.test_ascertain(cache.stats == {"hits": 1, "misses": 3, "evictions": 1, "entries": 2, "bytes": 2 * 16 * 16})
+        cls.test_ascertain(ImageCache.key(l_images[0], palette_a, 16, 16) not in cache)
+
+    @classmethod
+    def test_sprite_cache(cls):
+        image = np.random.randint(0, 4, (16, 32)).astype(np.int8)
+        s_image: str = ImageUtil.numpy_image_to_string(image)
+        with tempfile.TemporaryDirectory() as s_dir:
+            cls.test_ascertain((SpriteCache(s_dir).decode(s_image, 16, 32) == image).all())
+            cache: SpriteCache = SpriteCache(s_dir)
+            cached = cache.decode(s_image, 16, 32)
+            cls.test_ascertain(isinstance(cached, np.memmap) and (cached == image).all())
+            cls.test_ascertain(cache.stats == {"hits": 1, "misses": 0, "writes": 0, "rejects": 0})
+            # A corrupted file fails its hash check and is decoded again
+            s_key: str = SpriteCache.key(s_image, 16, 32)
+            s_path: str = cache.path(s_key, cache.index[s_key])
+            with open(s_path, "r+b") as f:
+                f.seek(-1, 2)
+                f.write(b"\xff")
+            cache = SpriteCache(s_dir)
+            cls.test_ascertain((cache.decode(s_image, 16, 32) == image).all())
+            cls.test_ascertain(cache.stats["rejects"] == 1 and cache.stats["writes"] == 1)
+
 
 if __name__ == "__main__":
     TestUtility.test_hydrate()
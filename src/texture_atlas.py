@@ -0,0 +1,134 @@
+#! usr/bin/env python3
+import hashlib
+import os
+import sys
+import numpy as np
+import pygame
+from typing import Dict, List, Tuple
+from src.utility_image import ImageUtil
+
+
+class TextureAtlas:
+    """ Many small palettized sprites packed into one 8-bit surface by a shelf packer.
+        Sprites are handed out as subsurfaces of the atlas, so they share its pixel memory.
+        Each entry remembers the content key of the image it came from, so a saved atlas
+        can be checked against a level's current images before it's reused.
+        Packing is opt-in (`LevelImage.image_pack`): frames are drawn from scaled, display-format copies,
+        so loading levels doesn't build an atlas.
+    """
+
+    WIDTH: int = 256
+    PADDING: int = 1
+    EXTENSION: str = ".npz"
+
+    __slots__ = [
+        "surface",
+        "rects",
+        "keys",
+        "_subsurfaces"
+    ]
+
+    def __init__(self, surface: pygame.Surface, rects: Dict[str, pygame.Rect], keys: Dict[str, str]):
+        self.surface: pygame.Surface = surface
+        self.rects: Dict[str, pygame.Rect] = rects
+        self.keys: Dict[str, str] = keys
+        self._subsurfaces: Dict[str, pygame.Surface] = {}
+
+    def __contains__(self, s_name: str) -> bool:
+        return s_name in self.rects
+
+    def __len__(self) -> int:
+        return len(self.rects)
+
+    @staticmethod
+    def key(s_value: str, i_w: int, i_h: int) -> str:
+        """ Returns the content key of an image string at a given size.
+        """
+        return hashlib.sha1("{}:{}:{}".format(s_value, i_w, i_h).encode()).hexdigest()
+
+    @staticmethod
+    def pack(d_sizes: Dict[str, Tuple[int, int]], i_width: int = WIDTH, i_padding: int = PADDING) -> Tuple[Dict[str, pygame.Rect], int]:
+        """ Shelf packer: places rects tallest-first, left to right, opening a new shelf when a row is full.
+            Returns each name's rect and the total height used.
+        """
+        i_width = max([i_width] + [w for w, _ in d_sizes.values()])
+        output: Dict[str, pygame.Rect] = {}
+        x, y, i_shelf = 0, 0, 0
+        for s_name, (w, h) in sorted(d_sizes.items(), key=lambda t: (-t[1][1], -t[1][0], t[0])):
+            if x + w > i_width:
+                x, y, i_shelf = 0, y + i_shelf + i_padding, 0
+            output[s_name] = pygame.Rect(x, y, w, h)
+            x += w + i_padding
+            i_shelf = max(i_shelf, h)
+        return output, y + i_shelf
+
+    @classmethod
+    def build(
+          cls,
+          d_surfaces: Dict[str, pygame.Surface],
+          palette: Dict[int, List[int]],
+          d_keys: Dict[str, str] = None,
+          i_width: int = WIDTH
+    ) -> "TextureAtlas":
+        """ Packs palettized surfaces into a new atlas. Pixel indices are copied exactly.
+        """
+        rects, i_height = cls.pack({k: v.get_size() for k, v in d_surfaces.items()}, i_width)
+        pixels: np.ndarray = np.zeros((max([i_width] + [r.right for r in rects.values()]), max(i_height, 1)), dtype=np.uint8)
+        for s_name, rect in rects.items():
+            pixels[rect.left:rect.right, rect.top:rect.bottom] = pygame.surfarray.array2d(d_surfaces[s_name])
+        return cls(ImageUtil.indexed_surface(pixels, palette), rects, dict(d_keys or {}))
+
+    def get(self, s_name: str) -> pygame.Surface:
+        """ Returns a sprite as a subsurface of the atlas.
+        """
+        try:
+            return self._subsurfaces[s_name]
+        except KeyError:
+            surface: pygame.Surface = self.surface.subsurface(self.rects[s_name])
+            self._subsurfaces[s_name] = surface
+            return surface
+
+    def set_palette(self, palette: Dict[int, List[int]]):
+        """ Recolors the atlas and every subsurface handed out so far.
+        """
+        l_colors: List[List[int]] = ImageUtil.palette_colors(palette)
+        self.surface.set_palette(l_colors)
+        for surface in self._subsurfaces.values():
+            surface.set_palette(l_colors)
+
+    def save(self, filename: str):
+        """ Writes the atlas (pixel indices, rects and content keys) to an .npz file.
+        """
+        l_names: List[str] = list(self.rects.keys())
+        np.savez_compressed(
+              filename,
+              pixels=pygame.surfarray.array2d(self.surface).astype(np.uint8),
+              names=np.array(l_names),
+              rects=np.array([tuple(self.rects[x]) for x in l_names], dtype=np.int32).reshape(-1, 4),
+              keys=np.array([self.keys.get(x, "") for x in l_names])
+        )
+
+    @classmethod
+    def load(cls, filename: str, palette: Dict[int, List[int]]) -> "TextureAtlas":
+        """ Reads an atlas written by `save`.
+        """
+        with np.load(filename) as data:
+            l_names: List[str] = [str(x) for x in data["names"]]
+            rects: Dict[str, pygame.Rect] = {k: pygame.Rect(*v) for k, v in zip(l_names, data["rects"].tolist())}
+            keys: Dict[str, str] = {k: str(v) for k, v in zip(l_names, data["keys"]) if v}
+            return cls(ImageUtil.indexed_surface(data["pixels"], palette), rects, keys)
+
+
+if __name__ == "__main__":
+    # Usage: python -m src.texture_atlas OUTPUT.npz (LEVEL.CCP | LIBRARY_NAME)
+    from src.block_system import BlockSystem
+    from src.level import Level
+    from src.level_image import LevelImage
+    from src.level_interface import LevelInterface
+    from src.level_script import LevelScript
+    if os.path.isfile(sys.argv[2]):
+        im = LevelImage()
+        Level.from_script(BlockSystem(), LevelInterface(), im, sys.argv[2])
+        im.image_pack().save(sys.argv[1])
+    else:
+        LevelScript.library(sys.argv[2]).image_atlas.save(sys.argv[1])
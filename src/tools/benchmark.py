@@ -0,0 +1,320 @@
+#! usr/bin/env python3
+import glob
+import os
+import re
+import sys
+import timeit
+import numpy as np
+import pygame
+from typing import Callable, List, Tuple
+from src.background import Background
+from src.block_system import BlockSystem
+from src.level import Level
+from src.level_image import LevelImage
+from src.level_interface import LevelInterface
+from src.render_context import HeadlessRenderContext, RenderContext
+from src.renderer import Renderer
+from src.utility import Utility
+from src.utility_image import ImageUtil
+
+
+class Benchmark:
+    """ Micro-benchmarks comparing current routines against their reference implementations.
+    """
+
+    REPEAT: int = 5
+    SETVALUE = re.compile(r"\[IMAGE SETVALUE]\s*<\s*\S+\s+(\S+)\s+(\d+)\s+(\d+)\s*>")
+
+    @staticmethod
+    def time(f: Callable, number: int, repeat: int = REPEAT) -> float:
+        """ Returns the best per-call time (in seconds) of a callable.
+        """
+        return min(timeit.repeat(f, number=number, repeat=repeat)) / number
+
+    @staticmethod
+    def report(name: str, f_old: float, f_new: float):
+        """ Prints one comparison row.
+        """
+        print("{:<32} {:>12.1f} us {:>12.1f} us {:>9.1f}x".format(name, f_old * 1e6, f_new * 1e6, f_old / f_new))
+
+    @staticmethod
+    def header():
+        print("{:<32} {:>15} {:>15} {:>10}".format("case", "reference", "current", "speedup"))
+
+    @staticmethod
+    def sample_images() -> List[Tuple[str, str, int, int]]:
+        """ Returns (name, image string, w, h) for every image in the level scripts and editor persist files.
+        """
+        output: List[Tuple[str, str, int, int]] = []
+        for s_file in sorted(glob.glob(Utility.abspath(__file__, "../../res/*.CCP"))):
+            with open(s_file, "r") as f:
+                for r in Benchmark.SETVALUE.finditer(f.read()):
+                    output.append((os.path.basename(s_file), r.group(1), int(r.group(2)), int(r.group(3))))
+        for s_file in sorted(glob.glob(Utility.abspath(__file__, "persist*.txt"))):
+            i_w, i_h, l_images = 0, 0, []
+            with open(s_file, "r") as f:
+                for line in f.readlines():
+                    a, b = [x.strip() for x in line.split(">>")]
+                    if a == "canvas_w":
+                        i_w = int(b)
+                    elif a == "canvas_h":
+                        i_h = int(b)
+                    elif re.fullmatch(r"canvas_\d+", a):
+                        l_images.append(b)
+            output.extend((os.path.basename(s_file), x, i_w, i_h) for x in l_images)
+        return output
+
+    @staticmethod
+    def codec(number: int = 20):
+        """ hydrate/dessicate against their reference implementations, per source file and on a large sprite.
+        """
+        l_cases: List[Tuple[str, List[str], int]] = []
+        for s_name, s_image, _, _ in Benchmark.sample_images():
+            if not l_cases or l_cases[-1][0] != s_name:
+                l_cases.append((s_name, [], number))
+            l_cases[-1][1].append(s_image)
+        # A 256x256 sprite made of the repo's own tiles, to show how each implementation scales
+        l_tiles: List[str] = [ImageUtil.hydrate(x) for _, l_images, _ in l_cases for x in l_images]
+        s_tiles: str = "".join(l_tiles)[:256 * 256 // 2]
+        l_cases.append(("256x256 (synthetic)", [ImageUtil.dessicate(s_tiles)], number))
+        # A 512x512 sprite with a 200-row blank band: one run whose count is too long to be a plain repeat
+        s_band: str = (s_tiles * 4)[:256 * 28 * 2] + "00" * (256 * 100) + (s_tiles * 4)[:256 * 128 * 2]
+        l_cases.append(("512x512 (blank band)", [ImageUtil.dessicate(s_band)], 1))
+
+        Benchmark.header()
+        for s_name, l_images, i_number in l_cases:
+            l_hex: List[str] = [ImageUtil.hydrate(x) for x in l_images]
+            assert [ImageUtil.hydrate_reference(x) for x in l_images] == l_hex
+            assert [ImageUtil.dessicate_reference(x) for x in l_hex] == [ImageUtil.dessicate(x) for x in l_hex]
+            Benchmark.report(
+                  "hydrate " + s_name,
+                  Benchmark.time(lambda: [ImageUtil.hydrate_reference(x) for x in l_images], i_number),
+                  Benchmark.time(lambda: [ImageUtil.hydrate(x) for x in l_images], i_number)
+            )
+            Benchmark.report(
+                  "dessicate " + s_name,
+                  Benchmark.time(lambda: [ImageUtil.dessicate_reference(x) for x in l_hex], i_number),
+                  Benchmark.time(lambda: [ImageUtil.dessicate(x) for x in l_hex], i_number)
+            )
+
+    @staticmethod
+    def encoder(number: int = 10):
+        """ numpy_image_to_string against its reference implementation (per-tile loop + reference dessicate).
+        """
+        l_cases: List[Tuple[str, List[np.ndarray]]] = []
+        for s_name, s_image, i_w, i_h in Benchmark.sample_images():
+            if not l_cases or l_cases[-1][0] != s_name:
+                l_cases.append((s_name, []))
+            l_cases[-1][1].append(ImageUtil.deserialize(s_image, i_w, i_h))
+        l_cases.append(("256x256 (random)", [np.random.randint(0, 4, (256, 256)).astype(np.int8)]))
+
+        Benchmark.header()
+        for s_name, l_images in l_cases:
+            assert [ImageUtil.numpy_image_to_string(x) for x in l_images] == \
+                   [ImageUtil.numpy_image_to_string_reference(x) for x in l_images]
+            Benchmark.report(
+                  "encode " + s_name,
+                  Benchmark.time(lambda: [ImageUtil.numpy_image_to_string_reference(x) for x in l_images], number),
+                  Benchmark.time(lambda: [ImageUtil.numpy_image_to_string(x) for x in l_images], number)
+            )
+
+    @staticmethod
+    def flip(number: int = 200):
+        """ One frame of the flip animation (every block at the same scale): per-frame scaling against cached frames.
+        """
+        im: LevelImage = LevelImage()
+        Level.from_script(BlockSystem(), LevelInterface(), im, Utility.abspath(__file__, "../../res/DUMMY_2.CCP"))
+        s_key: str = next(iter(im.image_key))
+        l_indices: List[int] = sorted(im.image_index[im.image_get_key(s_key)])
+        dest: pygame.Surface = pygame.Surface((320, 240))
+
+        def reference(f_scale: float):
+            for i_index in l_indices:
+                surface: pygame.Surface = im.image_get(s_key, i_index)
+                w, h = surface.get_size()
+                dest.blit(pygame.transform.scale(surface, (w, int(round(h * f_scale)))), (0, 0))
+
+        def current(f_scale: float):
+            for i_index in l_indices:
+                dest.blit(im.image_get_scaled(s_key, i_index, f_scale), (0, 0))
+
+        Benchmark.header()
+        for f_scale in (1.0, 0.5, 0.02):
+            Benchmark.report(
+                  "flip scale {}".format(f_scale),
+                  Benchmark.time(lambda: reference(f_scale), number),
+                  Benchmark.time(lambda: current(f_scale), number)
+            )
+
+    @staticmethod
+    def render(number: int = 200):
+        """ Level.render on a headless context: full repaints against dirty-rectangle frames.
+        """
+        level: Level = Level(HeadlessRenderContext())
+        level.load_from_script(Utility.abspath(__file__, "../../res/DUMMY_2.CCP"))
+        s_label: str = next(iter(level.interface.blocks))
+
+        def frame(b_full: bool, b_animate: bool):
+            if b_animate and not level.scale_changing:
+                level.press_block(*level.interface.block_get_position(s_label))
+            if b_full:
+                level.frame_state = ()
+            level.render(level.update())
+
+        Benchmark.header()
+        for s_case, b_animate in (("idle", False), ("flip animation", True)):
+            Benchmark.report(
+                  "render " + s_case,
+                  Benchmark.time(lambda: frame(True, b_animate), number),
+                  Benchmark.time(lambda: frame(False, b_animate), number)
+            )
+
+    @staticmethod
+    def upscale(number: int = 200):
+        """ Level.render at 2x per upscaling mode: a full-frame resample every frame against each mode's dirty frames.
+        """
+        level: Level = Level(HeadlessRenderContext())
+        level.load_from_script(Utility.abspath(__file__, "../../res/DUMMY_2.CCP"))
+        s_label: str = next(iter(level.interface.blocks))
+
+        def frame(s_mode: str, b_full: bool):
+            level.renderer.mode = s_mode
+            if not level.scale_changing:
+                level.press_block(*level.interface.block_get_position(s_label))
+            if b_full:
+                level.frame_state = ()
+            level.render(level.update())
+
+        Benchmark.header()
+        f_reference: float = Benchmark.time(lambda: frame("nearest", True), number)
+        for s_mode in Renderer.MODES:
+            Benchmark.report("upscale " + s_mode, f_reference, Benchmark.time(lambda: frame(s_mode, False), number))
+
+    @staticmethod
+    def blit(number: int = 2000):
+        """ Blits of each kind of surface Level draws: as created against converted to the display's format.
+            Needs a display to convert to; falls back to SDL's dummy driver if there's no other.
+        """
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        level: Level = Level(RenderContext())
+        level.load_from_script(Utility.abspath(__file__, "../../res/DUMMY_2.CCP"))
+        dest: pygame.Surface = level.renderer.internal
+        s_label, i_index = level.interface.block_get_image(next(iter(level.interface.blocks)))
+        background: pygame.Surface = pygame.surfarray.make_surface(pygame.surfarray.array3d(level.background))
+        l_cases: List[Tuple[str, pygame.Surface, pygame.Surface, int]] = [
+            ("blit sprite (8-bit)", level.images.image_get(s_label, i_index), level.images.image_get_display(s_label, i_index, 1.0), number),
+            ("blit background (24-bit)", background, ImageUtil.display_format(background), number // 20),
+            ("blit cursor (colorkey)", level.renderer.cursor_image(), level.renderer.cursor, number)
+        ]
+
+        Benchmark.header()
+        for s_name, source, converted, i_number in l_cases:
+            Benchmark.report(
+                  s_name,
+                  Benchmark.time(lambda: dest.blit(source, (8, 8)), i_number),
+                  Benchmark.time(lambda: dest.blit(converted, (8, 8)), i_number)
+            )
+
+    @staticmethod
+    def batch(number: int = 500):
+        """ A frame's worth of sprites: one draw_<anchor>/blit call per sprite against one batched `blits` call.
+        """
+        level: Level = Level(HeadlessRenderContext())
+        level.load_from_script(Utility.abspath(__file__, "../../res/DUMMY_2.CCP"))
+        renderer: Renderer = level.renderer
+        dest: pygame.Surface = renderer.internal
+        s_label, _ = level.interface.block_get_image(next(iter(level.interface.blocks)))
+        for i in range(4):
+            renderer.store(str(i), level.images.image_get(s_label, i))
+        l_items: List[Tuple[str, str, int, int]] = [(str(i % 4), "center", (i * 37) % 320, (i * 23) % 240) for i in range(100)]
+        l_blocks = list(level.block_frames().values())
+
+        def reference_items():
+            for key, _, x, y in l_items:
+                renderer.draw_center(dest, key, x, y)
+
+        def reference_blocks():
+            for im_blockimg, rect in l_blocks:
+                dest.blit(im_blockimg, rect)
+
+        Benchmark.header()
+        Benchmark.report("draw 100 stored sprites", Benchmark.time(reference_items, number), Benchmark.time(lambda: renderer.draw_batch(dest, l_items), number))
+        Benchmark.report(
+              "draw {} level blocks".format(len(l_blocks)),
+              Benchmark.time(reference_blocks, number),
+              Benchmark.time(lambda: renderer.blit_batch(dest, l_blocks), number)
+        )
+
+    @staticmethod
+    def scene(number: int = 500):
+        """ Compositing a full frame mid-flip: background plus every block against the static layer plus the animating blocks.
+        """
+        Level.STATIC_LAYER = True
+        level: Level = Level(HeadlessRenderContext())
+        level.load_from_script(Utility.abspath(__file__, "../../res/DUMMY_2.CCP"))
+        dest: pygame.Surface = level.renderer.target
+        level.press_block(*level.interface.block_get_position(next(iter(level.interface.blocks))))
+        level.render(0.05)
+        d_frames = level.block_frames()
+
+        def reference():
+            level.draw_background(dest)
+            level.renderer.blit_batch(dest, list(d_frames.values()))
+
+        def current():
+            layer, l_dynamic = level.scene_layers(d_frames)
+            dest.blit(layer, (0, 0))
+            level.renderer.blit_batch(dest, l_dynamic)
+
+        Benchmark.header()
+        Benchmark.report(
+              "composite {}/{} blocks animating".format(len(level.scene_layers(d_frames)[1]), len(d_frames)),
+              Benchmark.time(reference, number),
+              Benchmark.time(current, number)
+        )
+
+    @staticmethod
+    def background(number: int = 20):
+        """ Building a full-screen gradient: the old float meshgrid + smoothscale against the uint8 provider.
+        """
+        def reference(sw: int, sh: int) -> pygame.Surface:
+            xx, yy = np.meshgrid(np.arange(0, sw), np.arange(0, sh))
+            z = xx + yy
+            z = 255 * z / z.max()
+            ret = np.empty((*z.shape, 3), dtype=np.uint8)
+            ret[:, :, 2] = ret[:, :, 1] = ret[:, :, 0] = z
+            return pygame.transform.smoothscale(pygame.surfarray.make_surface(ret), (sw, sh))
+
+        Benchmark.header()
+        for size in ((320, 240), (720, 480)):
+            Benchmark.report(
+                  "gradient {}x{}".format(*size),
+                  Benchmark.time(lambda: reference(*size), number),
+                  Benchmark.time(lambda: ImageUtil.indexed_surface(Background.indices(size, "diagonal"), Background.GRAYS), number)
+            )
+            Benchmark.report(
+                  "gradient {}x{} (memoized)".format(*size),
+                  Benchmark.time(lambda: reference(*size), number),
+                  Benchmark.time(lambda: Background.get(size), number)
+            )
+
+
+def main():
+    d_benchmarks = {
+        "codec": Benchmark.codec,
+        "encoder": Benchmark.encoder,
+        "flip": Benchmark.flip,
+        "render": Benchmark.render,
+        "upscale": Benchmark.upscale,
+        "blit": Benchmark.blit,
+        "batch": Benchmark.batch,
+        "scene": Benchmark.scene,
+        "background": Benchmark.background,
+    }
+    for s_name in sys.argv[1:] or d_benchmarks.keys():
+        print("== {}".format(s_name))
+        d_benchmarks[s_name]()
+
+
+if __name__ == "__main__":
+    main()
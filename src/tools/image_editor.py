@@ -5,6 +5,7 @@ import pygame
 import pyperclip as pc
 import numpy as np
 from typing import List, Tuple, Dict
+from src.background import Background
 from src.utility_image import ImageUtil
 
 
@@ -23,6 +24,7 @@ class ImageEditor:
     HISTORY: int = 50
     NUM_CANVASES: int = 6
     FONT_SIZE: Tuple[int, int] = 8, 8
+    BINARY_PERSIST: bool = False  # Save canvases as zlib'd binary payloads instead of text
 
     __slots__ = [
         "background",
@@ -32,6 +34,7 @@ class ImageEditor:
         "working_images",
         "working_palettes",
         "working_transparencies",
+        "canvas_surfaces",
         "palette_indices",
         "canvas_index",
         "cursor",
@@ -108,6 +111,7 @@ class ImageEditor:
         self.canvas_index: int = int()
         self.palette_indices: List[int] = [int() for _ in range(num_canvases)]
         self.working_transparencies: Dict[int, Dict[int, int]] = dict()
+        self.canvas_surfaces: Dict[Tuple[int, bool], list] = dict()
         self.cursor: List[int] = [0, 0, 1, 1]
         self.multi_preview: List[int] = multi_preview
         self.histories: List[List[str]] = [list() for _ in range(num_canvases)]
@@ -266,22 +270,7 @@ class ImageEditor:
         pygame.display.set_caption(ImageEditor.CAPTION)
         display = pygame.display.set_mode((ImageEditor.SCREEN_WIDTH, ImageEditor.SCREEN_HEIGHT), ImageEditor.FLAGS, 32)
 
-        # Gray gradient background generation
-        def gray(im):
-            im = 255 * (im / im.max())
-            w, h = im.shape
-            ret = np.empty((w, h, 3), dtype=np.uint8)
-            ret[:, :, 2] = ret[:, :, 1] = ret[:, :, 0] = im
-            return ret
-
-        x = np.arange(0, ImageEditor.SCREEN_WIDTH)
-        y = np.arange(0, ImageEditor.SCREEN_HEIGHT)
-        xx, yy = np.meshgrid(x, y)
-        z = xx + yy
-        z = 255 * z / z.max()
-        z = gray(z)
-        s = pygame.surfarray.make_surface(z)
-        s = pygame.transform.smoothscale(s, (ImageEditor.SCREEN_WIDTH, ImageEditor.SCREEN_HEIGHT))  # TODO
+        s = Background.get((ImageEditor.SCREEN_WIDTH, ImageEditor.SCREEN_HEIGHT))
 
         #s = pygame.Surface((ImageEditor.SCREEN_WIDTH, ImageEditor.SCREEN_HEIGHT))
         #s.fill((0, 0, 0))
@@ -425,7 +414,7 @@ class ImageEditor:
             f.write(f"canvas_h>>{self.working_image_h}\n")
             f.write(f"num_canvases>>{self.num_canvases}\n")
             for n in range(self.num_canvases):
-                f.write(f"canvas_{n}>>{self.export_nth_image(n)}\n")
+                f.write(f"canvas_{n}>>{self.export_nth_image(n, ImageEditor.BINARY_PERSIST)}\n")
             for n in range(self.num_canvases):
                 f.write(f"palette_{n}>>{self.working_palettes[n]}\n")
             for n in self.working_transparencies:
@@ -464,10 +453,12 @@ class ImageEditor:
                 pygame.draw.circle(dest, (64, 64, 64), (int(x1), y), 1)
                 x1 += dx * y / dy
 
-    def export_nth_image(self, n: int) -> str:
-        """ Converts an arbitrary canvas to an image string.
+    def export_nth_image(self, n: int, binary: bool = False) -> str:
+        """ Converts an arbitrary canvas to an image string (or binary payload).
         """
         working_image = self.working_images[n]
+        if binary:
+            return ImageUtil.numpy_image_to_binary(working_image)
         return ImageUtil.numpy_image_to_string(working_image)
 
     def export_image(self) -> str:
@@ -501,15 +492,31 @@ class ImageEditor:
         scale_x = ImageEditor.PIXEL_WIDTH if do_scale else 1
         scale_y = ImageEditor.PIXEL_HEIGHT if do_scale else 1
         working_image = self.working_images[index]
-        working_palette = self.working_palettes[index]
-        for m in range(working_image.shape[0]):
-            for n in range(working_image.shape[1]):
-                palette_enum = self.get_pixel(working_image, m, n)
-                if palette_enum != self.working_transparencies[index][working_palette]:
-                    color = self.palettes[working_palette][palette_enum]
-                    pygame.draw.rect(dest, color, (x + m * scale_x, y + n * scale_y, scale_x, scale_y))
+        dest.blit(self.canvas_surface(index, do_scale), (x, y))
         return scale_x * working_image.shape[1], scale_y * working_image.shape[0]
 
+    def canvas_surface(self, index: int, do_scale: bool = True) -> pygame.Surface:
+        """ Returns the (scaled) palettized surface of a canvas, kept across frames.
+            It's rebuilt only when the canvas's pixels change; a palette or transparency change just recolors it.
+        """
+        scale_x = ImageEditor.PIXEL_WIDTH if do_scale else 1
+        scale_y = ImageEditor.PIXEL_HEIGHT if do_scale else 1
+        working_image = self.working_images[index]
+        working_palette = self.working_palettes[index]
+        colors = ImageUtil.palette_colors(self.palettes[working_palette])
+        entry = self.canvas_surfaces.get((index, do_scale))
+        if entry is None or entry[0].shape != working_image.shape or not np.array_equal(entry[0], working_image):
+            surface = ImageUtil.indexed_surface(working_image, self.palettes[working_palette])
+            if do_scale:
+                surface = pygame.transform.scale(surface, (scale_x * working_image.shape[0], scale_y * working_image.shape[1]))
+            entry = self.canvas_surfaces[index, do_scale] = [working_image.copy(), surface, colors]
+        elif entry[2] != colors:
+            entry[1].set_palette(colors)
+            entry[2] = colors
+        transparency = self.working_transparencies[index][working_palette]
+        entry[1].set_colorkey(transparency if transparency >= 0 else None)
+        return entry[1]
+
     def draw_palette(self, dest: pygame.Surface) -> Tuple[int, int]:
         """ Renders the palette bar.
         """
@@ -1,7 +1,17 @@
 #! usr/bin/env python3
 import os
 import re
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+class ScriptError(ValueError):
+    """ Raised when a script statement cannot be interpreted.
+    """
+
+    def __init__(self, filename: str, i_line: int, message: str):
+        super().__init__("{}:{}: {}".format(filename, i_line, message))
+        self.filename: str = filename
+        self.line: int = i_line
 
 
 class ScriptParser:
@@ -10,6 +20,9 @@ class ScriptParser:
 
     HEADER = re.compile(r"\[(\s*\S+(?:\s+\S+)*\s*)]")
     PARAMS = re.compile(r"<(\s*\S+(?:\s+\S+)*\s*)>")
+    TERMINATOR: str = "!"
+    CHUNK_SIZE: int = 16384
+    VERSION: int = 1  # Bump whenever tokenized output changes; invalidates cached parses
 
     @classmethod
     def parse(cls, filename: str) -> Dict[int, Tuple[Tuple[str], Tuple[str]]]:
@@ -18,24 +31,58 @@ class ScriptParser:
             to interpret what the dictionary elements actually mean.
         """
         output: Dict[int, Tuple[Tuple[str], Tuple[str]]] = {}
-        with open(filename, "r") as f:
-            s_contents: str = " ".join(f.readlines())
-            l_statements: List[str] = s_contents.split("!")
-            for i_num, s_statement in enumerate(l_statements):
-                t_header: Tuple[str] = tuple()
-                t_params: Tuple[str] = tuple()
-                r_header = ScriptParser.HEADER.search(s_statement)
-                if r_header:
-                    s_header: str = r_header.group(1)
-                    t_header = tuple(s_header.split())
-                r_params = ScriptParser.PARAMS.search(s_statement)
-                if r_params:
-                    s_params: str = r_params.group(1)
-                    t_params = tuple(s_params.split())
-                if t_header:
-                    output[i_num] = (t_header, t_params)
+        for i_num, (t_header, t_params, _) in enumerate(cls.stream(filename)):
+            output[i_num] = (t_header, t_params)
         return output
 
+    @classmethod
+    def stream(cls, filename: str, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[Tuple[str], Tuple[str], int]]:
+        """ Reads a text file in chunks and yields (header, params, line number) for each statement
+            as soon as its terminator is read. Line numbers are 1-based and point at the header.
+        """
+        with open(filename, "r") as f:
+            yield from cls.stream_chunks(iter(lambda: f.read(chunk_size), str()))
+
+    @classmethod
+    def stream_chunks(cls, chunks: Iterable[str]) -> Iterator[Tuple[Tuple[str], Tuple[str], int]]:
+        """ Tokenizes statements from an iterable of text chunks. See `stream`.
+        """
+        l_pending: List[str] = []
+        i_line: int = 1
+        for s_chunk in chunks:
+            # Only the unterminated tail of a chunk is carried over to the next one
+            l_statements: List[str] = s_chunk.split(cls.TERMINATOR)
+            s_tail: str = l_statements.pop()
+            if l_statements:
+                l_pending.append(l_statements[0])
+                l_statements[0] = str().join(l_pending)
+                l_pending.clear()
+            l_pending.append(s_tail)
+            for s_statement in l_statements:
+                t_statement = cls.tokenize(s_statement, i_line)
+                if t_statement:
+                    yield t_statement
+                i_line += s_statement.count("\n")
+        t_statement = cls.tokenize(str().join(l_pending), i_line)
+        if t_statement:
+            yield t_statement
+
+    @classmethod
+    def tokenize(cls, s_statement: str, i_line: int = 1) -> Tuple[Tuple[str], Tuple[str], int]:
+        """ Splits a single (unterminated) statement into its header and params.
+            Returns an empty tuple if the statement has no header.
+        """
+        r_header = cls.HEADER.search(s_statement)
+        if not r_header:
+            return tuple()
+        t_header: Tuple[str] = tuple(r_header.group(1).split())
+        t_params: Tuple[str] = tuple()
+        r_params = cls.PARAMS.search(s_statement)
+        if r_params:
+            t_params = tuple(r_params.group(1).split())
+        i_line += s_statement.count("\n", 0, r_header.start())
+        return t_header, t_params, i_line
+
 
 class Utility:
     """ Various utility methods.
@@ -1,7 +1,9 @@
+import base64
 import pygame
 import re
+import zlib
 import numpy as np
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 class ImageUtil:
     """ Utility methods to transform text-formatted images to pygame/SDL bitmap surfaces.
@@ -57,38 +59,141 @@ class ImageUtil:
     PALETTE_I_2: List[int] = [64, 32, 40]
     PALETTE_I_3: List[int] = [0, 0, 0]
 
+    # Pairwise compression alphabet: "00" -> "g" -> ("gg") -> "G", ..., "ff" -> "x" -> ("xx") -> "X"
+    HEX_DIGITS: str = "0123456789abcdef"
+    PAIR_LOWER: str = "ghijkmnpqrstuvwx"
+    PAIR_UPPER: str = "GHIJKMNPQRSTUVWX"
+    REPEATS: Dict[int, re.Pattern] = {n: re.compile(r"(\w{{{}}})\1+".format(n)) for n in range(2, 5)}
+    COLLAPSED: Dict[int, re.Pattern] = {n: re.compile(r"\((\w{{{}}}),(\d+)\)".format(n)) for n in range(2, 5)}
+    PAIRS: re.Pattern = re.compile(r"([0-9a-f])\1\1\1|([0-9a-f])\2")
+    PAIRED: Dict[str, str] = {
+          **{x * 4: y for x, y in zip(HEX_DIGITS, PAIR_UPPER)},
+          **{x * 2: y for x, y in zip(HEX_DIGITS, PAIR_LOWER)}
+    }
+    UNPAIRED: Dict[int, str] = {
+          **{ord(y): x * 4 for x, y in zip(HEX_DIGITS, PAIR_UPPER)},
+          **{ord(y): x * 2 for x, y in zip(HEX_DIGITS, PAIR_LOWER)}
+    }
+
+    # Binary payloads: base64 of the packed 2bpp bytes, optionally zlib-compressed first
+    BINARY_RAW: str = "b64:"
+    BINARY_ZLIB: str = "z64:"
+    BINARY_PREFIXES: Tuple[str, str] = (BINARY_RAW, BINARY_ZLIB)
+
+    # Bumped whenever the display is (re)opened; caches of display_format copies compare against it
+    DISPLAY_GENERATION: int = 0
+
+    # Bit offsets of the four 2-bit pixels packed into each byte
+    SHIFTS: np.ndarray = np.array([6, 4, 2, 0], dtype=np.uint8)
+
     @staticmethod
     def convert_image(inputs: str, palette: Dict[int, List[int]], w: int, h: int) -> pygame.Surface:
-        """ Converts a string to a pygame surface.
+        """ Converts a string to an 8-bit palettized pygame surface.
+        """
+        return ImageUtil.indexed_surface(ImageUtil.deserialize(inputs, w, h), palette)
+
+    @staticmethod
+    def indexed_surface(image: np.ndarray, palette: Dict[int, List[int]]) -> pygame.Surface:
+        """ Converts a numpy array of palette indices to an 8-bit palettized surface.
+            Recoloring it later is just a `set_palette`; the pixels are never touched again.
         """
-        image: np.ndarray = ImageUtil.deserialize(inputs, w, h)
-        k = np.array(list(palette.keys()))
-        v = np.array(list(palette.values()))
-        mapping_ar = np.zeros((k.max() + 1, 3), dtype=v.dtype)
-        mapping_ar[k] = v
-        out = mapping_ar[image]
-        return pygame.surfarray.make_surface(out)
+        surface: pygame.Surface = pygame.Surface(image.shape, 0, 8)
+        pygame.surfarray.blit_array(surface, image.astype(np.uint8))
+        surface.set_palette(ImageUtil.palette_colors(palette))
+        return surface
+
+    @staticmethod
+    def display_format(surface: pygame.Surface) -> pygame.Surface:
+        """ Returns a copy of a surface in the display's pixel format, so blitting it needs no per-pixel conversion.
+            Colorkeys are RLE-accelerated. Without a display (headless), the surface is returned as is.
+        """
+        if pygame.display.get_surface() is None:
+            return surface
+        if surface.get_flags() & pygame.SRCALPHA:
+            return surface.convert_alpha()
+        output: pygame.Surface = surface.convert()
+        colorkey = surface.get_colorkey()
+        if colorkey is not None:
+            output.set_colorkey(colorkey, pygame.RLEACCEL)
+        return output
+
+    @staticmethod
+    def display_changed():
+        """ Marks every display_format copy made so far as stale. Called whenever the display is (re)opened.
+        """
+        ImageUtil.DISPLAY_GENERATION += 1
+
+    @staticmethod
+    def palette_colors(palette: Dict[int, List[int]]) -> List[List[int]]:
+        """ Returns a palette as a list of colors ordered by index, as `Surface.set_palette` expects.
+        """
+        return [palette.get(n, ImageUtil.DEFAULT_PALETTE_3) for n in range(max(palette) + 1)]
 
     @staticmethod
     def deserialize(inputs: str, w: int, h: int) -> np.ndarray:
-        """ Converts an image string to a numpy array.
-        """
-        hexstring = ImageUtil.hydrate(inputs)
-        image: np.ndarray = np.zeros((w, h), dtype=np.int8)
-        cursor: int = 0
-        for y in range(0, w, 2):
-            for x in range(0, h, 2):
-                substring = hexstring[cursor:cursor + 2]
-                cursor += 2
-                f = bytes.fromhex(substring)
-                e = int.from_bytes(f, 'big')
-                a = (e & 0b11000000) >> 6
-                b = (e & 0b00110000) >> 4
-                c = (e & 0b00001100) >> 2
-                d = (e & 0b00000011)
-                g = np.array([[a, b], [c, d]])
-                image[y:y + 2, x:x + 2] = g
-        return image
+        """ Converts an image string (text or binary payload) to a numpy array.
+        """
+        if ImageUtil.is_binary(inputs):
+            return ImageUtil.unpack(ImageUtil.decode_binary(inputs), w, h)
+        i_tiles: int = (w // 2) * (h // 2)
+        return ImageUtil.unpack(bytes.fromhex(ImageUtil.hydrate(inputs)[:i_tiles * 2]), w, h)
+
+    @staticmethod
+    def unpack(raw: bytes, w: int, h: int) -> np.ndarray:
+        """ Converts packed 2bpp bytes to a numpy array. Missing trailing bytes are treated as zero.
+            Each byte holds a 2x2 tile of 2-bit pixels (top-left, top-right, bottom-left, bottom-right),
+            with tiles stored in row-major order.
+        """
+        i_tiles: int = (w // 2) * (h // 2)
+        data: np.ndarray = np.zeros(i_tiles, dtype=np.uint8)
+        raw = raw[:i_tiles]
+        data[:len(raw)] = np.frombuffer(raw, dtype=np.uint8)
+        fields: np.ndarray = (data[:, np.newaxis] >> ImageUtil.SHIFTS) & 0b11
+        tiles: np.ndarray = fields.reshape(w // 2, h // 2, 2, 2)
+        return tiles.transpose(0, 2, 1, 3).reshape(w, h).astype(np.int8)
+
+    @staticmethod
+    def pack(working_image: np.ndarray) -> bytes:
+        """ Converts a numpy array to packed 2bpp bytes. Inverse of `unpack`.
+        """
+        h, w = working_image.shape
+        tiles: np.ndarray = working_image.reshape(h // 2, 2, w // 2, 2).transpose(0, 2, 1, 3).reshape(-1, 4)
+        return np.bitwise_or.reduce(tiles.astype(np.uint8) << ImageUtil.SHIFTS, axis=1).tobytes()
+
+    @staticmethod
+    def is_binary(inputs: str) -> bool:
+        """ Returns true if an image string is a binary (base64) payload; false if it's the text format.
+        """
+        return inputs.startswith(ImageUtil.BINARY_PREFIXES)
+
+    @staticmethod
+    def decode_binary(inputs: str) -> bytes:
+        """ Returns the packed 2bpp bytes of a binary payload.
+        """
+        raw: bytes = base64.b64decode(inputs[len(ImageUtil.BINARY_RAW):])
+        if inputs.startswith(ImageUtil.BINARY_ZLIB):
+            raw = zlib.decompress(raw)
+        return raw
+
+    @staticmethod
+    def encode_binary(raw: bytes, compress: bool = True) -> str:
+        """ Converts packed 2bpp bytes to a binary payload. Inverse of `decode_binary`.
+        """
+        if compress:
+            return ImageUtil.BINARY_ZLIB + base64.b64encode(zlib.compress(raw, 9)).decode("ascii")
+        return ImageUtil.BINARY_RAW + base64.b64encode(raw).decode("ascii")
+
+    @staticmethod
+    def numpy_image_to_binary(working_image: np.ndarray, compress: bool = True) -> str:
+        """ Converts a numpy array to a binary payload: packed 2bpp bytes, optionally zlib'd, in base64.
+        """
+        return ImageUtil.encode_binary(ImageUtil.pack(working_image), compress)
+
+    @staticmethod
+    def to_binary(inputs: str, compress: bool = True) -> str:
+        """ Converts a text image string to a binary payload without going through a numpy array.
+        """
+        return ImageUtil.encode_binary(bytes.fromhex(ImageUtil.hydrate(inputs)), compress)
 
     @staticmethod
     def hex_to_rgb(hexstr: str) -> List[int]:
@@ -102,40 +207,61 @@ class ImageUtil:
     @staticmethod
     def dessicate(image: str) -> str:
         """ 'Shrinks' an image string.
+            Repeats are collapsed in one linear regex scan per sequence length. The output is identical
+            to `dessicate_reference`, except where the reference rewrites the digits of a long count
+            (e.g. a run of 1212 pairs followed by "1212"), which it can't hydrate back; this one can.
         """
-        # Simple pairwise character compression
-        image = image.replace("00", "g")
-        image = image.replace("11", "h")
-        image = image.replace("22", "i")
-        image = image.replace("33", "j")
-        image = image.replace("44", "k")
-        image = image.replace("55", "m")
-        image = image.replace("66", "n")
-        image = image.replace("77", "p")
-        image = image.replace("88", "q")
-        image = image.replace("99", "r")
-        image = image.replace("aa", "s")
-        image = image.replace("bb", "t")
-        image = image.replace("cc", "u")
-        image = image.replace("dd", "v")
-        image = image.replace("ee", "w")
-        image = image.replace("ff", "x")
-        image = image.replace("gg", "G")
-        image = image.replace("hh", "H")
-        image = image.replace("ii", "I")
-        image = image.replace("jj", "J")
-        image = image.replace("kk", "K")
-        image = image.replace("mm", "M")
-        image = image.replace("nn", "N")
-        image = image.replace("pp", "P")
-        image = image.replace("qq", "Q")
-        image = image.replace("rr", "R")
-        image = image.replace("ss", "S")
-        image = image.replace("tt", "T")
-        image = image.replace("uu", "U")
-        image = image.replace("vv", "V")
-        image = image.replace("ww", "W")
-        image = image.replace("xx", "X")
+        image = ImageUtil.pair(image)
+
+        # Collapse repeating sequences
+        for n in range(2, 5):
+            image = ImageUtil.REPEATS[n].sub(lambda m: "({},{})".format(m.group(1), len(m.group(0)) // n), image)
+
+        return image
+
+    @staticmethod
+    def hydrate(image: str) -> str:
+        """ 'Grows' an image string.
+            Repeats are expanded in one linear regex scan per sequence length;
+            the output is identical to `hydrate_reference`. Binary payloads are expanded to hex.
+        """
+        if ImageUtil.is_binary(image):
+            return ImageUtil.decode_binary(image).hex()
+
+        # Expand repeating sequences
+        for n in range(4, 1, -1):
+            image = ImageUtil.COLLAPSED[n].sub(ImageUtil.expand, image)
+
+        return ImageUtil.unpair(image)
+
+    @staticmethod
+    def expand(m: re.Match) -> str:
+        """ Expands one "(unit,count)" match. A count with a leading zero (e.g. "05") is left as is,
+            since the reference searches for the normalized "(unit,5)" and never matches it.
+        """
+        s_count: str = m.group(2)
+        if len(s_count) > 1 and s_count[0] == "0":
+            return m.group(0)
+        return m.group(1) * int(s_count)
+
+    @staticmethod
+    def pair(image: str) -> str:
+        """ Simple pairwise character compression: "00" -> "g", ..., then "gg" -> "G", ...
+            One regex scan over a hex string: each run of a digit becomes its 4-runs, then a pair, then a single.
+        """
+        return ImageUtil.PAIRS.sub(lambda m: ImageUtil.PAIRED[m.group(0)], image)
+
+    @staticmethod
+    def unpair(image: str) -> str:
+        """ Simple expansion of pairwise characters. Inverse of `pair`.
+        """
+        return image.translate(ImageUtil.UNPAIRED)
+
+    @staticmethod
+    def dessicate_reference(image: str) -> str:
+        """ Original implementation of `dessicate`. Quadratic; kept for benchmarking and edge cases.
+        """
+        image = ImageUtil.pair(image)
 
         # Collapse repeating sequences
         for n in range(2, 5):
@@ -149,8 +275,8 @@ class ImageUtil:
         return image
 
     @staticmethod
-    def hydrate(image: str) -> str:
-        """ 'Grows' an image string.
+    def hydrate_reference(image: str) -> str:
+        """ Original implementation of `hydrate`. Quadratic; kept for benchmarking and edge cases.
         """
         # Expand repeating sequences
         for n in range(4, 1, -1):
@@ -160,41 +286,7 @@ class ImageUtil:
                 _3 = int(_1[1])
                 image = re.sub(r"\({},{}\)".format(_2, _3), _2 * _3, image, 1)
 
-        # Simple expansion of pairwise characters
-        image = image.replace("X", "xx")
-        image = image.replace("W", "ww")
-        image = image.replace("V", "vv")
-        image = image.replace("U", "uu")
-        image = image.replace("T", "tt")
-        image = image.replace("S", "ss")
-        image = image.replace("R", "rr")
-        image = image.replace("Q", "qq")
-        image = image.replace("P", "pp")
-        image = image.replace("N", "nn")
-        image = image.replace("M", "mm")
-        image = image.replace("K", "kk")
-        image = image.replace("J", "jj")
-        image = image.replace("I", "ii")
-        image = image.replace("H", "hh")
-        image = image.replace("G", "gg")
-        image = image.replace("x", "ff")
-        image = image.replace("w", "ee")
-        image = image.replace("v", "dd")
-        image = image.replace("u", "cc")
-        image = image.replace("t", "bb")
-        image = image.replace("s", "aa")
-        image = image.replace("r", "99")
-        image = image.replace("q", "88")
-        image = image.replace("p", "77")
-        image = image.replace("n", "66")
-        image = image.replace("m", "55")
-        image = image.replace("k", "44")
-        image = image.replace("j", "33")
-        image = image.replace("i", "22")
-        image = image.replace("h", "11")
-        image = image.replace("g", "00")
-
-        return image
+        return ImageUtil.unpair(image)
 
     @staticmethod
     def new_palette(a: List[int], b: List[int], c: List[int], d: List[int]) -> Dict[int, List[int]]:
@@ -204,6 +296,14 @@ class ImageUtil:
 
     @staticmethod
     def numpy_image_to_string(working_image: np.ndarray) -> str:
+        """ Converts a numpy array to an image string. Inverse of `deserialize`.
+        """
+        return ImageUtil.dessicate(ImageUtil.pack(working_image).hex())
+
+    @staticmethod
+    def numpy_image_to_string_reference(working_image: np.ndarray) -> str:
+        """ Original implementation of `numpy_image_to_string`. Kept for benchmarking.
+        """
         output = str()
         for y in range(0, working_image.shape[0], 2):
             for x in range(0, working_image.shape[1], 2):
@@ -217,5 +317,5 @@ class ImageUtil:
                 f = e.to_bytes(1, 'big')
                 g = f.hex()
                 output += g
-        output = ImageUtil.dessicate(output)
+        output = ImageUtil.dessicate_reference(output)
         return output